@@ -1,30 +1,28 @@
-from intermine.webservice import Service
-from intermine.model import ModelError
-import os
-import pandas as pd
+# startup comes first, so that the startup time is measured from before anything else is imported
+from startup import LazyModule, check_installed, warm_up, window_shown
+from instrumentation import timed, write_report
+from mines import service_urls
+from progress_dialog import ProgressDialog
 import sys
 import tkinter as tk
 import tkinter.ttk as ttk
 import tkinter.filedialog as fd
 import tkinter.messagebox as messagebox
 
-service_urls = {
-    'Drosophila melanogaster': "https://www.flymine.org/query/service",
-    'Danio rerio': "https://zmine.zfin.org/service",
-    'Caenorhabditis elegans': "https://intermine.wormbase.org/tools/wormmine/service",
-    'Rattus norvegicus': "https://ratmine.org/ratmine/service",
-    'Mus musculus': "https://www.mousemine.org/mousemine/service",
-    'Homo sapiens': "https://www.humanmine.org/humanmine/service",
-}
+# the window comes up with tkinter alone; these are imported in the background once it is shown (see startup)
+exporters = LazyModule('exporters')
+intermine_utils = LazyModule('intermine_utils')
+netr_core = LazyModule('netr_core')
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+synonym_index = LazyModule('synonym_index')
+check_installed(('intermine', 'numpy', 'pandas'))
 
+# modules imported in the background while the window is shown
+HEAVY_MODULES = ('pandas', 'intermine_utils', 'netr_core', 'synonym_index', 'exporters')
 
-def intermine_query(ids, organism, *args):
-    service = Service(service_urls[organism])
-    query = service.new_query("Gene", case_sensitive=True)
-    query.add_constraint("Gene", "LOOKUP", ids, code="A")
-    query.add_constraint("organism.name", "=", organism, code="B")
-    query.select(*args)
-    return query
+# number of rows read from an attribute table to preview it
+PREVIEW_ROWS = 5
 
 
 class GUI(tk.Tk):
@@ -72,6 +70,11 @@ class GUI(tk.Tk):
             combobox_values[combobox_values.index("Drosophila melanogaster")])
         self.organism_picker.grid(row=0, column=1, sticky='w')
 
+        if self.controller.handed_over:
+            # the network comes from NetR, so its organism is known
+            self.organism_picker.set(self.controller.info['Organism'])
+            self.organism_picker.state(['disabled'])
+
     def netr_submission(self, row, column):
         frame = ttk.Frame(self.container)
         frame.grid(row=row, column=column, sticky='nsew')
@@ -87,6 +90,10 @@ class GUI(tk.Tk):
                                                  command=lambda: self.browse(self.netr_filepath))
         self.netr_submission_button.grid(row=0, column=2, sticky='e')
 
+        if self.controller.handed_over:
+            self.netr_filepath.set("(network from NetR)")
+            self.netr_submission_button.state(['disabled'])
+
     def attribute_submission(self, row, column):
         frame = ttk.Frame(self.container)
         frame.grid(row=row, column=column, sticky='nsew')
@@ -135,6 +142,11 @@ class GUI(tk.Tk):
                                                   text="Check if the attribute table has a header.")
         self.header_checkbutton.grid(row=1, column=0, sticky='w')
 
+        self.sparse_lists = tk.BooleanVar()
+        self.sparse_lists_checkbutton = ttk.Checkbutton(frame, variable=self.sparse_lists,
+                                                        text="Export List attributes as a separate gene/list table.")
+        self.sparse_lists_checkbutton.grid(row=2, column=0, sticky='w')
+
     def buttons(self, row, column):
         frame = ttk.Frame(self.container)
         frame.grid(row=row, column=column, sticky='e')
@@ -155,18 +167,23 @@ class GUI(tk.Tk):
 
     def submit1(self):
         if self.netr_filepath.get():
-            netr_df = pd.read_csv(self.netr_filepath.get())
-            self.controller.info['NetR DataFrame'] = netr_df
-            self.controller.info['Organism'] = self.org_name.get()
+            if not self.controller.handed_over:
+                # only the primary identifier columns of the NetR table are used; the network can be in any of the
+                # formats NetR saves
+                netr_df = exporters.read_network_ids(self.netr_filepath.get())
+                self.controller.info['NetR DataFrame'] = netr_df
+                self.controller.info['Organism'] = self.org_name.get()
 
             if self.attribute_filepath.get():
+                # only the first rows are read to preview the table; the named columns are read in full once the
+                # user has named them
                 if self.header.get():
-                    attribute_df = pd.read_csv(self.attribute_filepath.get())
+                    attribute_df = pd.read_csv(self.attribute_filepath.get(), nrows=PREVIEW_ROWS)
                 else:
                     attribute_df = pd.read_csv(
-                        self.attribute_filepath.get(), header=None)
+                        self.attribute_filepath.get(), header=None, nrows=PREVIEW_ROWS)
                 AttributePreview(self, attribute_df,
-                                 self.header.get(), self.table_type.get())
+                                 self.header.get(), self.table_type.get(), self.attribute_filepath.get())
 
             else:
                 messagebox.showwarning(
@@ -198,7 +215,7 @@ class GUI(tk.Tk):
 
 
 class AttributePreview(tk.Toplevel):
-    def __init__(self, parent, table, header, table_type):
+    def __init__(self, parent, table, header, table_type, path):
         tk.Toplevel.__init__(self, parent)
 
         self.controller = parent
@@ -208,7 +225,9 @@ class AttributePreview(tk.Toplevel):
         self.container.rowconfigure(1, weight=1)
         self.container.pack(fill='both', expand=True)
 
+        # the first rows of the table; okay reads the columns that are used from 'path'
         self.table = table
+        self.path = path
         self.table_type = table_type
         self.header = header
 
@@ -275,21 +294,23 @@ class AttributePreview(tk.Toplevel):
 
         ttk.Button(frame, text='Okay', command=self.okay).grid(row=0, column=1)
 
+    @timed('AttributePreview.okay')
     def okay(self):
         # For Lists we just need the user to name the columns (if they want to exclude a column, leave blank ).
         # and for Discrete/Continuous we will need the user to name the column and pick the Mapping Key
 
-        # CONSIDER moving this to submit1
-        self.controller.controller.create_node_dataframe()
-
-        def create_mapping_key_synonym_dataframe():
-            mapping_key = self.table['Mapping Key'].tolist()
-            query = intermine_query(','.join(mapping_key),
-                                    self.controller.controller.info['Organism'], 'synonyms.value',
-                                    'symbol')
+        # change the column name of the Mapping key column to 'Mapping Key'. The column names are read here, since
+        # the tables are processed in the background, where Tk variables cannot be used
+        if self.table_type == 'Discrete/Continuous':
+            self.column_names[self.mapping_key_column.get()].set('Mapping Key')
+        names = [name.get() for name in self.column_names]
 
-            synonym_dataframe = pd.DataFrame(list(query.rows()), columns=[
-                                             'Synonyms', 'Updated Mapping Key'])
+        @timed('AttributePreview.okay: create_mapping_key_synonym_dataframe')
+        def create_mapping_key_synonym_dataframe(mapping_key):
+            synonym_dataframe = intermine_utils.lookup_frame(mapping_key, self.controller.controller.info['Organism'],
+                                                             ['synonyms.value', 'symbol'],
+                                                             columns=['Synonyms', 'Updated Mapping Key'],
+                                                             categorical=['Synonyms', 'Updated Mapping Key'])
 
             symbol_df = pd.concat(
                 [synonym_dataframe['Updated Mapping Key']] * 2, axis=1)
@@ -313,122 +334,293 @@ class AttributePreview(tk.Toplevel):
             except KeyError:
                 pass
 
+        @timed('AttributePreview.okay: list_attributes')
         def list_attributes():
             # if the table is a List
 
             # remove unnamed columns
-            self.table.columns = [name.get() for name in self.column_names]
+            self.table.columns = names
             remove_unnamed_columns()
 
-            # update the ids and append the attribute to List attributes
-            for column, name in enumerate(self.table.columns):
-                query = intermine_query(','.join(str(item) for item in list(self.table.iloc[:, column])),
-                                        self.controller.controller.info['Organism'], 'symbol')
-
-                self.controller.controller.info['List Attributes'].append(
-                    pd.Series([row['symbol'] for row in query.rows()],
-                              name=name))
+            # update the ids and append the attribute to List attributes. The IDs of all columns are resolved
+            # together, so the table costs one lookup however many columns it has
+            frames = intermine_utils.lookup_frames(
+                [self.table.iloc[:, column] for column in range(self.table.shape[1])],
+                self.controller.controller.info['Organism'], ['symbol'], categorical=['symbol'])
+            for frame, name in zip(frames, self.table.columns):
+                self.controller.controller.info['List Attributes'].append(frame['symbol'].rename(name))
 
+        @timed('AttributePreview.okay: discrete_continuous_attributes')
         def discrete_continuous_attributes():
             # if table type is Discrete/Continuous
 
-            # change the column name of the Mapping key column to 'Mapping Key' and remove unnamed columns
-            self.column_names[self.mapping_key_column.get()].set('Mapping Key')
-            self.table.columns = [name.get() for name in self.column_names]
+            # remove unnamed columns
+            self.table.columns = names
             remove_unnamed_columns()
 
             nodes = self.controller.controller.nodes
+            index = synonym_index.load_index(self.controller.controller.info['Organism'])
+
+            if index is None and 'Synonyms' not in nodes:
+                # a network handed over from NetR only comes with the symbols of its nodes; their synonyms are looked
+                # up, so the table is reduced to the network before any of its keys are
+                node_ids = self.controller.controller.info['Node Symbols'].index.tolist()
+                nodes = intermine_utils.lookup_frame(node_ids, self.controller.controller.info['Organism'],
+                                                     ['synonyms.value', 'symbol'], columns=['Synonyms', 'Symbol'],
+                                                     categorical=['Synonyms', 'Symbol'])
+
+            if index is None:
+                # reduces the attribute table to rows relevant for the  provided network table
+                self.table = self.table[self.table['Mapping Key'].isin(nodes['Synonyms']) |
+                                        self.table['Mapping Key'].isin(nodes['Symbol'])]
+
+                # update gene ids
+                updated_key = create_mapping_key_synonym_dataframe(self.table['Mapping Key'].tolist())
+                self.table = self.table.merge(updated_key, how='left', left_on='Mapping Key',
+                                              right_on='Synonyms')
+                self.table.drop(['Mapping Key', 'Synonyms'], axis=1, inplace=True)
+                self.table.rename(
+                    columns={'Updated Mapping Key': 'Mapping Key'}, inplace=True)
 
-            # reduces the attribute table to rows relevant for the  provided network table
-            self.table = self.table[self.table['Mapping Key'].isin(nodes['Synonyms']) |
-                                    self.table['Mapping Key'].isin(nodes['Symbol'])]
-
-            # update gene ids
-            updated_key = create_mapping_key_synonym_dataframe()
-            self.table = self.table.merge(updated_key, how='left', left_on='Mapping Key',
-                                          right_on='Synonyms')
-            self.table.drop(['Mapping Key', 'Synonyms'], axis=1, inplace=True)
-            self.table.rename(
-                columns={'Updated Mapping Key': 'Mapping Key'}, inplace=True)
-
-            # store
-            self.controller.controller.info['Discrete and Continuous Attributes'] = self.controller.controller.info[
-                'Discrete and Continuous Attributes'].merge(self.table, how='outer', on='Mapping Key')
-
-        if self.table_type == 'List':
-            list_attributes()
-        elif self.table_type == 'Discrete/Continuous':
-            discrete_continuous_attributes()
-
-        self.withdraw()
-        self.controller.submit2()
+            else:
+                # update gene ids with the synonym index; only the keys it does not know are looked up in the mine,
+                # and of those only the ones that can match a node, so a genome-wide attribute table does not mean a
+                # genome-wide lookup
+                keys = self.table['Mapping Key']
+                updated = pd.Series(index.map(keys), index=self.table.index, dtype=object)
+                unknown = keys[updated.isna() & keys.isin(nodes['Symbol'])]
+                if not unknown.empty:
+                    updated_key = create_mapping_key_synonym_dataframe(unknown.tolist())
+                    updated = updated.fillna(keys.map(updated_key.set_index('Synonyms')['Updated Mapping Key']))
+                self.table['Mapping Key'] = updated
+
+                # reduces the attribute table to rows relevant for the  provided network table
+                self.table = self.table[self.table['Mapping Key'].isin(nodes['Symbol'])]
+
+            # store; the tables are combined once, when the attribute table is made
+            self.controller.controller.info['Discrete and Continuous Attributes'].append(self.table)
+
+        # only the named columns are read; identifiers are read as text
+        used = [position for position, name in enumerate(names) if name]
+        labels = [self.table.columns[position] for position in used]
+        dtype = str if self.table_type == 'List' else {self.table.columns[self.mapping_key_column.get()]: str}
+        names = [names[position] for position in used]
+
+        def work():
+            # the table is read again on every try, so it is intact if a previous one was cancelled
+            table = pd.read_csv(self.path, header=0 if self.header else None, usecols=used, dtype=dtype)
+            self.table = table[labels]
+
+            # CONSIDER moving this to submit1
+            self.controller.controller.create_node_dataframe()
+
+            if self.table_type == 'List':
+                list_attributes()
+            elif self.table_type == 'Discrete/Continuous':
+                discrete_continuous_attributes()
+
+        def done(result):
+            self.withdraw()
+            self.controller.submit2()
+
+        # if the work is cancelled the preview stays open, so the table can be submitted again
+        ProgressDialog(self, work, done, title="Resolving the attribute table")
+
+
+class MembershipMatrix:
+    """
+        Records which nodes belong to each List attribute as a packed bitset: one row of bits per attribute, one bit
+        per node. Memberships are only expanded to boolean columns by to_frame, or listed as (node, attribute) pairs
+        by to_long"""
+
+    def __init__(self, nodes):
+        self.nodes = pd.Index(np.asarray(nodes, dtype=object))
+        self.names = []
+        self.rows = []
+
+    def add(self, name, members):
+        members = pd.Series(np.asarray(members, dtype=object)).dropna().unique()
+        positions = self.nodes.get_indexer(members)
+        positions = positions[positions >= 0]
+
+        row = np.zeros((len(self.nodes) + 7) // 8, dtype=np.uint8)
+        np.bitwise_or.at(row, positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8))
+        self.names.append(name)
+        self.rows.append(row)
+
+    def __len__(self):
+        return len(self.names)
+
+    def bits(self):
+        """Returns the packed bitset as an (attributes, bytes) uint8 array"""
+        if not self.rows:
+            return np.zeros((0, (len(self.nodes) + 7) // 8), dtype=np.uint8)
+        return np.vstack(self.rows)
+
+    def to_frame(self, index=None):
+        """Returns one boolean column per attribute, with a row per node"""
+        dense = np.unpackbits(self.bits(), axis=1, count=len(self.nodes)).astype(bool).T
+        return pd.DataFrame(dense, columns=self.names, index=index)
+
+    def to_long(self):
+        """Returns a row per (node, attribute) membership, with the columns Mapping Key and List Attribute"""
+        attributes, nodes = np.nonzero(np.unpackbits(self.bits(), axis=1, count=len(self.nodes)))
+        return pd.DataFrame({'Mapping Key': self.nodes[nodes],
+                             'List Attribute': np.asarray(self.names, dtype=object)[attributes]})
 
 
 class AttR:
     """ info contains:
        'Organism' (string),
-       'NetR DataFrame' (pandas dataframe)
+       'NetR DataFrame' (pandas dataframe, None until a NetR table is submitted)
        'List Attributes' (list of pandas Series each of which is a list of gene identifiers)
-       'Discrete and Continuous Attributes' (pandas DataFrame which has a mix of discrete and/or
-                                             continuous values along with the corresponding Mapping Key column as
-                                             index)"""
-    info = {'NetR DataFrame': pd.DataFrame(),
-            'List Attributes': [],
-            'Discrete and Continuous Attributes': pd.DataFrame(columns=['Mapping Key']),
-            'Organism': ''}
-
-    def __init__(self):
-        # The graphical interface is launched by instantiating a GUI object
-        self.gui = GUI(self)
-        self.gui.mainloop()
+       'Node Symbols' (pandas Series of the nodes' symbols indexed by their primary identifiers, when the network was
+                       handed over by NetR)
+       'Discrete and Continuous Attributes' (list of pandas DataFrames each of which has a mix of discrete and/or
+                                             continuous values along with the corresponding Mapping Key column)"""
+
+    def __init__(self, gui=True, network=None, organism=None):
+        self.new_run(network, organism)
+
+        # The graphical interface is launched by instantiating a GUI object; without it, info is filled in by the
+        # caller and the table is built with create_node_dataframe and make_attribute_table. Reset rebuilds the window
+        # in this process, so the imported modules, the InterMine services and the lookup cache stay warm
+        self.restart = gui
+        while self.restart:
+            self.restart = False
+            self.gui = GUI(self)
+            self.gui.after_idle(self.shown)
+            self.gui.mainloop()
+
+    def new_run(self, network=None, organism=None):
+        self.info = {'NetR DataFrame': None,
+                     'List Attributes': [],
+                     'Discrete and Continuous Attributes': [],
+                     'Organism': ''}
+        for name in ('nodes', 'output', 'membership'):
+            self.__dict__.pop(name, None)
+
+        # NetR can hand its network over in the same process, together with the symbols it already resolved, so
+        # neither the CSV file nor the nodes have to be read and looked up again
+        self.handed_over = network is not None
+        if self.handed_over:
+            self.info.update({'NetR DataFrame': network,
+                              'Node Symbols': netr_core.node_symbols(network),
+                              'Organism': organism})
+        # when set, List attributes are exported as a separate table of (gene, list) pairs instead of a boolean column
+        # per list
+        self.sparse_lists = False
 
     @staticmethod
-    def reset():
-        python = sys.executable
+    def shown():
+        window_shown()
+        warm_up(HEAVY_MODULES)
+
+    def reset(self):
+        write_report()
         sys.stdout.flush()
-        os.execl(python, python, *sys.argv)
+        self.new_run()
+        if hasattr(self, 'gui'):
+            # closing the window ends its mainloop, and __init__ opens a new one
+            self.restart = True
+            self.gui.destroy()
 
     def extract_primary_ids_from_netr(self):
-        primary_ids_df = pd.concat([self.info['NetR DataFrame'].iloc[:, 0],
-                                    self.info['NetR DataFrame'].iloc[:, 6]],
+        # the primary identifiers are the first and seventh columns of a NetR table; only those two are read from a
+        # NetR file
+        netr_df = self.info['NetR DataFrame']
+        primary_ids_df = pd.concat([netr_df.iloc[:, 0], netr_df.iloc[:, 6 if netr_df.shape[1] > 6 else 1]],
                                    ignore_index=True)
         primary_ids_list = primary_ids_df.tolist()
 
         return ','.join(str(this_id) for this_id in primary_ids_list)
 
+    @timed('AttR.create_node_dataframe')
     def create_node_dataframe(self):
-        query = intermine_query(self.extract_primary_ids_from_netr(),
-                                self.info['Organism'], 'synonyms.value', 'symbol')
-
-        self.nodes = pd.DataFrame(list(query.rows()), columns=[
-                                  'Synonyms', 'Symbol'])
-
-    def make_attribute_table(self):
+        if self.info.get('Node Symbols') is not None:
+            # only the nodes NetR could not resolve are looked up
+            symbols = self.info['Node Symbols']
+            unknown = symbols.index[symbols.isna()].tolist()
+            symbols = symbols.dropna().tolist()
+            if unknown:
+                symbols += intermine_utils.lookup_frame(unknown, self.info['Organism'], ['symbol'])['symbol'].tolist()
+            self.nodes = pd.DataFrame({'Symbol': intermine_utils.as_categorical(symbols)})
+            return
+
+        index = synonym_index.load_index(self.info['Organism'])
+        if index is None:
+            self.nodes = intermine_utils.lookup_frame(self.extract_primary_ids_from_netr(), self.info['Organism'],
+                                                      ['synonyms.value', 'symbol'], columns=['Synonyms', 'Symbol'],
+                                                      categorical=['Synonyms', 'Symbol'])
+            return
+
+        # with a synonym index the nodes only need their current symbol, which the index has for every identifier it
+        # knows; the synonyms of the nodes are not needed to remap Mapping Keys
+        ids = intermine_utils.unique_ids(self.extract_primary_ids_from_netr())
+        symbols = index.map(ids)
+        unknown = [gene_id for gene_id, symbol in zip(ids, symbols) if symbol is None]
+        symbols = [symbol for symbol in symbols if symbol is not None]
+        if unknown:
+            symbols += intermine_utils.lookup_frame(unknown, self.info['Organism'], ['symbol'])['symbol'].tolist()
+        self.nodes = pd.DataFrame({'Symbol': intermine_utils.as_categorical(symbols)})
+
+    @timed('AttR.combine_attribute_tables')
+    def combine_attribute_tables(self):
+        """
+            Combines the submitted Discrete/Continuous tables into one DataFrame indexed by Mapping Key, with a single
+            index-aligned concat. Each table first keeps only the first of the rows that share a Mapping Key, whole,
+            so duplicated keys cannot multiply rows; column names used by more than one table get a '.1', '.2', ...
+            suffix"""
+        tables = []
+        names = {}
+        for table in self.info['Discrete and Continuous Attributes']:
+            table = table.dropna(subset=['Mapping Key']).drop_duplicates('Mapping Key').set_index('Mapping Key')
+
+            columns = []
+            for name in table.columns:
+                columns.append(name if name not in names else '{}.{}'.format(name, names[name]))
+                names[name] = names.get(name, 0) + 1
+            table.columns = columns
+
+            tables.append(table)
+
+        return pd.concat(tables, axis=1, join='outer')
+
+    @timed('AttR.make_attribute_table')
+    def make_attribute_table(self, export=True):
 
         self.output = self.nodes['Symbol'].to_frame(
             name='Mapping Key').drop_duplicates()
 
-        # if there is at least 1 submitted Discrete/Continuous Dataset, left merge the output and combined
-        # discrete/continuous dataframe (all discrete/continuous dataframes were combined into a single dataframe as
-        # they were being submitted
-        if not self.info['Discrete and Continuous Attributes'].empty:
-            self.output = self.output.merge(self.info['Discrete and Continuous Attributes'], how='left',
-                                            on='Mapping Key')
+        # if there is at least 1 submitted Discrete/Continuous Dataset, left join the output and the combined
+        # discrete/continuous dataframe
+        if self.info['Discrete and Continuous Attributes']:
+            self.output = self.output.join(self.combine_attribute_tables(), on='Mapping Key')
 
-        # for each list attribute add a new column to the output dataframe, containing boolean values, indicating
-        # whether the given gene was found in the submitted attribute list
+        # record, for each list attribute, which genes of the output were found in the submitted attribute list. The
+        # memberships are kept as bits and only become columns of the output when it is exported
+        self.membership = MembershipMatrix(self.output['Mapping Key'])
         for attribute in self.info['List Attributes']:
-            result = self.output['Mapping Key'].isin(attribute)
-            result.name = attribute.name
-
-            self.output = pd.concat([self.output, result], axis=1)
+            self.membership.add(attribute.name, attribute)
 
         # export the dataframe as a CSV file
-        self.export_table()
+        if export:
+            self.export_table()
+
+    def attribute_table(self):
+        """Returns the output with a boolean column per List attribute, indicating whether the gene was in the list"""
+        return pd.concat([self.output, self.membership.to_frame(self.output.index)], axis=1)
 
     def export_table(self):
-        self.output.set_index('Mapping Key', inplace=True)
-        self.output.to_csv(fd.asksaveasfile(defaultextension='csv'))
+        sparse = self.sparse_lists or (hasattr(self, 'gui') and self.gui.sparse_lists.get())
+        table = self.output if sparse else self.attribute_table()
+        table = table.set_index('Mapping Key')
+        # the format is chosen from the extension of the file name (CSV, compressed CSV, Parquet or Arrow)
+        path = fd.asksaveasfilename(defaultextension='.csv', filetypes=exporters.filetypes(graph=False))
+        if path:
+            exporters.write_table(table, path)
+            if sparse:
+                exporters.write_table(self.membership.to_long(), exporters.sibling_path(path, '_lists'), index=False)
 
         self.reset()
 
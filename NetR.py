@@ -1,14 +1,23 @@
 try:
-    from intermine.webservice import Service
-    from intermine.model import ModelError
-    import os
-    import pandas as pd
+    # startup comes first, so that the startup time is measured from before anything else is imported
+    from startup import LazyModule, check_installed, warm_up, window_shown
+    from instrumentation import write_report
+    from mines import service_urls
+    from progress_dialog import ProgressDialog
+    from AttR import AttR
     import sys
     import tkinter as tk
     import tkinter.ttk as ttk
     import tkinter.filedialog as fd
     import tkinter.messagebox as messagebox
 
+    # the window comes up with tkinter alone; these are imported in the background once it is shown (see startup)
+    exporters = LazyModule('exporters')
+    intermine_utils = LazyModule('intermine_utils')
+    netr_core = LazyModule('netr_core')
+    pd = LazyModule('pandas')
+    check_installed(('intermine', 'numpy', 'pandas'))
+
 except ImportError as error:
     try:
         import tkinter.messagebox as messagebox
@@ -18,131 +27,6 @@ except ImportError as error:
     except ImportError:
         raise SystemExit(repr(error))
 
-service_urls = {
-    'Drosophila melanogaster': "https://www.flymine.org/query/service",
-    'Danio rerio': "https://zmine.zfin.org/service",
-    'Caenorhabditis elegans': "https://intermine.wormbase.org/tools/wormmine/service",
-    'Rattus norvegicus': "https://ratmine.org/ratmine/service",
-    'Mus musculus': "https://www.mousemine.org/mousemine/service",
-    'Homo sapiens': "https://www.humanmine.org/humanmine/service",
-}
-
-
-def intermine_query(ids, organism, *args):
-    service = Service(service_urls[organism])
-    query = service.new_query("Gene", case_sensitive=True)
-    query.add_constraint("Gene", "LOOKUP", ids, code="A")
-    query.add_constraint("organism.name", "=", organism, code="B")
-    query.select(*args)
-    return query
-
-
-class Network:
-    """
-        Iterable container for wheels
-        Organism will be set when the first element is added
-        Download will be set when the first element is added (this way if the database does not have interaction
-        data, we can turn off the integration and continue with the standalone mode)"""
-
-    container = []
-    index = -1
-
-    def __init__(self, download=False):
-        self.download = download
-
-    def append(self, wheel):
-        self.container.append(wheel)
-        if len(self.container) == 1:
-            self.organism = wheel.organism
-
-    def __iter__(self):
-        """Makes Network an Iterator"""
-        return self
-
-    def __next__(self):
-        """Iterates over the container"""
-        self.index += 1
-        if self.index >= len(self.container):
-            raise StopIteration
-        return self.container[self.index]
-
-    def __getitem__(self, item):
-        return self.container[item]
-
-    def __setitem__(self, key, value):
-        self.container[key] = value
-
-
-class Wheel:
-    def __init__(self, info):
-        self.organism = info['organism']
-        self.core = info['core']
-        self.technique = info['technique']
-        self.ids = list(info['ids'])
-        self.ids.append(self.core)
-        self.download = info['download']
-
-    def update_core(self):
-        # make an intermine query with the core genes information
-        query = intermine_query(self.core, self.organism, [
-                                'primaryIdentifier', 'secondaryIdentifier', 'symbol'])
-
-        self.core = pd.DataFrame(list(query.rows()), columns=[
-                                 'primaryIdentifier', 'secondaryIdentifier', 'symbol'])
-
-    def update_primaries(self):
-        query = intermine_query(','.join(str(item) for item in list(self.ids)), self.organism,
-                                ['symbol', 'secondaryIdentifier',
-                                'primaryIdentifier'])
-
-        self.primary_interactors_df = pd.DataFrame(list(query.rows()), columns=['symbol', 'secondaryIdentifier',
-                                                                                'primaryIdentifier'])
-
-        self.primary_interactors_df['interactions.details.type'] = self.technique
-
-        new_cols = list(self.primary_interactors_df.columns)
-        new_cols = new_cols[-1:] + new_cols[:-1]
-
-        self.primary_interactors_df = self.primary_interactors_df[new_cols]
-
-    def get_secondaries(self):
-        query = intermine_query(','.join(str(item) for item in list(self.ids)), self.organism,
-                                ['primaryIdentifier', 'secondaryIdentifier',
-                                'symbol', 'interactions.details.type',
-                                 'interactions.participant2.symbol',
-                                 'interactions.participant2.'
-                                 'secondaryIdentifier',
-                                 'interactions.participant2.'
-                                 'primaryIdentifier'])
-
-        self.secondary_interactors_df = pd.DataFrame(list(query.rows()), columns=["Source Primary Identifier",
-                                                                                  "Source Secondary Identifier",
-                                                                                  "Source Symbol",
-                                                                                  "Interaction",
-                                                                                  "Target Symbol",
-                                                                                  "Target Secondary Identifier",
-                                                                                  "Target Primary Identifier"
-                                                                                  ])
-
-    def convert_to_dataframe(self):
-
-        self.dataframe = pd.concat([pd.concat([self.core] * self.primary_interactors_df.shape[0], ignore_index=True),
-                                    self.primary_interactors_df], axis=1, ignore_index=True)
-
-        self.dataframe.columns = [
-            "Source Primary Identifier",
-            "Source Secondary Identifier",
-            "Source Symbol",
-            "Interaction",
-            "Target Symbol",
-            "Target Secondary Identifier",
-            "Target Primary Identifier"
-        ]
-
-        if hasattr(self, 'secondary_interactors_df'):
-            self.dataframe = self.dataframe.append(
-                self.secondary_interactors_df, ignore_index=True)
-
 
 class GUI(tk.Tk):
     """
@@ -235,6 +119,11 @@ class GUI(tk.Tk):
                                                   text="Check if the file has a header.")
         self.header_checkbutton.grid(row=1, column=0, sticky='w')
 
+        self.collapse = tk.BooleanVar()
+        self.collapse_checkbutton = ttk.Checkbutton(frame, variable=self.collapse,
+                                                    text="Merge duplicate edges into one row.")
+        self.collapse_checkbutton.grid(row=2, column=0, sticky='w')
+
     def dataset_reference(self, row, column):
         dataset_reference_frame = ttk.Frame(self)
         dataset_reference_frame.grid(row=row, column=column, sticky='nsew')
@@ -254,11 +143,8 @@ class GUI(tk.Tk):
         ttk.Button(button_frame, text="Submit", command=self.submit1).grid(
             row=0, column=2, sticky='e')
 
-    def validate_core_gene(self):
-        query = intermine_query(self.core_var.get(), self.org_name.get(),
-                                ['primaryIdentifier', 'secondaryIdentifier', 'symbol'])
-
-        if query.count == 0:
+    def validate_core_gene(self, rows):
+        if not rows:
             messagebox.showinfo(
                 message='Invalid core gene identifier. Please enter a valid core gene identifier.')
             self.core_var.set("")
@@ -271,23 +157,34 @@ class GUI(tk.Tk):
         stored in the 'self.info' dictionary under the appropriate keys. The file is read and  converted to a dataframe
         and based on this dataframe a preview window is generated that allows the user to select the correct column(s).
         This column information is used to trim the dataframe and only include the selected columns. The trimmed
-        dataframe is stored in self.info['DataFrame']. Finally, 'self.info' is passed to NetR for further processing"""
+        dataframe is stored in self.info['DataFrame']. Finally, 'self.info' is passed to NetR for further processing.
+        The core gene is looked up in the background; the submission continues in core_gene_checked"""
 
-        if self.validate_core_gene():
+        # CORE_VIEWS selects the same paths as PRIMARY_VIEWS, so a network built with fused=False finds the core gene
+        # in the cache. The default fused build queries it again, together with the wheel's other IDs
+        core, organism = self.core_var.get(), self.org_name.get()
+        ProgressDialog(self, lambda: intermine_utils.lookup_rows(core, organism, netr_core.CORE_VIEWS),
+                       self.core_gene_checked, title="Checking the core gene")
+
+    def core_gene_checked(self, rows):
+        if self.validate_core_gene(rows):
             self.controller.info.update({
                 'dataset_name': self.dataset_name_var.get(),
                 'organism': self.org_name.get(),
                 'core': self.core_var.get(),
                 'technique': self.technique_var.get(),
                 'ids': None,
+                'file': self.file_path.get(),
+                'header': self.header.get(),
             })
 
-            # if the user has selected a file it is read into a DataFrame
+            # if the user has selected a file, its first rows are read into a DataFrame to preview it. The selected
+            # columns are read in full once the user has picked them
             if self.file_path.get() is not None:
                 if self.header.get():
-                    df = pd.read_csv(self.file_path.get())
+                    df = pd.read_csv(self.file_path.get(), nrows=netr_core.PREVIEW_ROWS)
                 else:
-                    df = pd.read_csv(self.file_path.get(), header=None)
+                    df = pd.read_csv(self.file_path.get(), header=None, nrows=netr_core.PREVIEW_ROWS)
                 Preview(self, df)
 
     def submit2(self):
@@ -297,23 +194,12 @@ class GUI(tk.Tk):
 
             # Check that the selected InterMine has interaction data
             if self.controller.info['download']:
-                try:
-                    intermine_query(self.controller.info['ids'], self.controller.info['organism'],
-                                    ['primaryIdentifier', 'secondaryIdentifier',
-                                     'symbol', 'interactions.details.type',
-                                     'interactions.participant2.symbol',
-                                     'interactions.participant2.'
-                                     'secondaryIdentifier',
-                                     'interactions.participant2.'
-                                     'primaryIdentifier'])
-                except ModelError:
+                if not netr_core.interactions_available(self.controller.info['organism']):
                     self.controller.info['download'] = False
                     messagebox.showwarning(title="Interaction data not available for {organism}. "
                                                  "The network will be made without integrating "
                                                  "intermine data.".format(organism=self.controller.info['organism']))
 
-            self.controller.wheels.download = self.controller.info['download']
-
         # a Wheel object is created based on self.info and stored in a Network object
         self.controller.add_wheel(self.controller.info)
 
@@ -392,54 +278,88 @@ class Preview(tk.Toplevel):
             self.select_column(button_ref)
 
     def okay(self):
-        self.controller.controller.info['ids'] = pd.concat((self.table.iloc[:,
-                                                            col].str.strip() for col in self.columns_to_use),
-                                                           ignore_index=True)
+        info = self.controller.controller.info
+        info['columns'] = list(self.columns_to_use)
+
+        # only the selected columns of the file are read, in the background
+        ProgressDialog(self, lambda: netr_core.read_dataset_ids(info['file'], info['columns'], info['header']),
+                       self.loaded, title="Reading the data set")
+
+    def loaded(self, ids):
+        self.controller.controller.info['ids'] = ids
         self.state('withdrawn')
         self.controller.submit2()
 
 
-class NetR:
-    info = {}  # self.info stores all the information submitted by the user for the current dataset
+# modules imported in the background while the window is shown
+HEAVY_MODULES = ('pandas', 'intermine_utils', 'netr_core', 'exporters')
 
-    # a container for Wheels
-    wheels = Network()
 
+class NetR:
     def __init__(self):
-        # The graphical interface is launched by instantiating a GUI object
-        self.gui = GUI(self)
-        self.gui.mainloop()
+        self.attr_handoff = None
+
+        # Reset rebuilds the window in this process, so the imported modules, the InterMine services and the lookup
+        # cache stay warm from one run to the next
+        self.restart = True
+        while self.restart:
+            self.restart = False
+            self.info = {}  # self.info stores all the information submitted by the user for the current dataset
+            self.wheels = None  # a Network, the container for Wheels, made when the first dataset is added
+
+            # The graphical interface is launched by instantiating a GUI object
+            self.gui = GUI(self)
+            self.gui.after_idle(self.shown)
+            self.gui.mainloop()
+
+        # the network is handed over to AttR once the NetR window is closed
+        if self.attr_handoff is not None:
+            AttR(**self.attr_handoff)
+
+    @staticmethod
+    def shown():
+        window_shown()
+        warm_up(HEAVY_MODULES)
 
     def add_wheel(self, info):
-        self.wheels.append(Wheel(info))
+        if self.wheels is None:
+            self.wheels = netr_core.Network(info['download'])
+        self.wheels.append(netr_core.Wheel(info))
 
     def make_network(self):
-        # for each user-submitted wheel
-        try:
-            for wheel in self.wheels:
-                wheel.update_core()
-                wheel.update_primaries()
-                if self.wheels.download:
-                    wheel.get_secondaries()
-                wheel.convert_to_dataframe()
-
-            self.master_dataframe = pd.concat(
-                [wheel.dataframe for wheel in self.wheels.container])
-        except ValueError as ve:
-            if str(ve) == 'No objects to concatenate':
-                self.master_dataframe = self.wheels[0].dataframe
-            else:
-                raise ve
-
-        self.master_dataframe.to_csv(fd.asksaveasfilename(
-            defaultextension='.csv'), index=False)
-        self.reset()
+        # the network is built in the background, so the window stays responsive and the build can be cancelled.
+        # Wheels that were built before from the same inputs are restored instead of being queried again
+        collapse = self.gui.collapse.get()
+        ProgressDialog(self.gui, lambda: netr_core.make_network(self.wheels, collapse=collapse,
+                                                                store=netr_core.wheel_store_from_environment()),
+                       self.save_network, title="Building the network", cancelled=self.network_cancelled)
 
     @staticmethod
-    def reset():
-        python = sys.executable
+    def network_cancelled():
+        messagebox.showinfo(message="The network was not built. Submit another data set to build it again, "
+                                    "or press Reset to start over.")
+
+    def save_network(self, master_dataframe):
+        self.master_dataframe = master_dataframe
+
+        # the format is chosen from the extension of the file name (CSV, compressed CSV, Parquet, GraphML, ...)
+        path = fd.asksaveasfilename(defaultextension='.csv', filetypes=exporters.filetypes())
+        if path:
+            exporters.write_network(self.master_dataframe, path)
+
+        if messagebox.askyesno(message="Would you like to add attributes to this network in AttR?"):
+            # AttR is started in this process with the network and the symbols NetR resolved
+            self.attr_handoff = {'network': self.master_dataframe, 'organism': self.wheels.organism}
+            self.gui.destroy()
+        else:
+            self.reset()
+
+    def reset(self):
+        # closing the window ends its mainloop, and __init__ opens a new one with empty state
+        write_report()
         sys.stdout.flush()
-        os.execl(python, python, *sys.argv)
+        self.restart = True
+        self.gui.destroy()
 
 
 if __name__ == '__main__':
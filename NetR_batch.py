@@ -0,0 +1,141 @@
+"""
+    Builds NetR networks without the graphical interface
+
+    Usage:
+        python NetR_batch.py manifest.json [manifest.json ...]
+
+    Every manifest describes one network (or a list of networks) as JSON:
+
+        {
+            "output": "network.csv",
+            "organism": "Drosophila melanogaster",
+            "download": true,
+            "datasets": [
+                {"name": "screen 1", "file": "screen1.csv", "columns": [0, 2], "header": false,
+                 "core": "zen", "technique": "Y2H"}
+            ]
+        }
+
+    "organism" and "download" can also be given per dataset; columns are positions, or names when the file has a
+    header. Setting "fused" to false resolves identifiers and interactions with separate queries. Setting "collapse" to
+    true merges duplicate edges into one row with an evidence count and the contributing datasets; with "directed" set
+    to false, A-B and B-A count as the same edge. Relative paths are resolved from the folder of the manifest. The
+    format of the network follows the extension of "output": .csv, .csv.gz, .parquet, .arrow, .graphml or .cx.
+
+    Interaction data is expanded beyond the submitted IDs with "hops" (e.g. 2 or 3), bounded by "max_hop_nodes",
+    "max_hop_edges", "max_nodes" and "max_edges"; "interaction_types" (e.g. ["physical"]) restricts the interactions
+    that are followed.
+
+    All manifests are processed in one process, so the InterMine cache and Service objects stay warm from one network
+    to the next. Wheels whose dataset file, columns, core, technique, organism and download flag did not change since
+    they were last built are restored from ~/.netrattr/wheels instead of being queried again. With --report (or the
+    NETRATTR_REPORT environment variable), a JSON report of the time spent in each stage is written at the end of the
+    run"""
+
+from exporters import network_writer
+from instrumentation import enable, write_report
+from intermine_utils import cache
+from netr_core import (Network, Wheel, Expansion, interactions_available, make_network, read_dataset_ids,
+                       wheel_store_from_environment)
+import argparse
+import json
+import os
+import sys
+
+EXPANSION_OPTIONS = ('hops', 'max_hop_nodes', 'max_hop_edges', 'max_nodes', 'max_edges', 'interaction_types')
+
+
+def load_manifests(path):
+    with open(path) as manifest_file:
+        manifests = json.load(manifest_file)
+    if isinstance(manifests, dict):
+        manifests = [manifests]
+
+    # paths in the manifest are relative to the manifest itself
+    folder = os.path.dirname(os.path.abspath(path))
+    for manifest in manifests:
+        manifest['output'] = os.path.join(folder, manifest['output'])
+        for dataset in manifest.get('datasets', ()):
+            dataset['file'] = os.path.join(folder, dataset['file'])
+    return manifests
+
+
+def build_network(manifest):
+    """
+        Runs the Wheel/Network pipeline for one manifest, writing the network to its output path, and returns the
+        number of edges written"""
+    datasets = manifest.get('datasets')
+    if not datasets:
+        raise ValueError("The manifest lists no datasets; add at least one to \"datasets\"")
+    organism = datasets[0].get('organism', manifest.get('organism'))
+    download = datasets[0].get('download', manifest.get('download', False))
+
+    if download and not interactions_available(organism):
+        print("Interaction data not available for {}. The network will be made without integrating intermine "
+              "data.".format(organism), file=sys.stderr)
+        download = False
+
+    network = Network(download)
+    for dataset in datasets:
+        if dataset.get('organism', organism) != organism:
+            raise ValueError("All datasets in a network must belong to the same organism "
+                             "({} is {})".format(dataset['name'], dataset['organism']))
+
+        network.append(Wheel({
+            'dataset_name': dataset['name'],
+            'organism': organism,
+            'core': dataset['core'],
+            'technique': dataset.get('technique', ''),
+            'ids': read_dataset_ids(dataset['file'], dataset['columns'], dataset.get('header', False)),
+            'download': download,
+            'file': dataset['file'],
+            'columns': dataset['columns'],
+            'header': dataset.get('header', False),
+        }))
+
+    expansion = None
+    if any(option in manifest for option in EXPANSION_OPTIONS):
+        expansion = Expansion(**{option: manifest[option] for option in EXPANSION_OPTIONS if option in manifest})
+
+    # the edges of every wheel are written as soon as the wheel is done, so the whole network is never held in memory
+    try:
+        with network_writer(manifest['output'], directed=manifest.get('directed', True)) as writer:
+            return make_network(network, fused=manifest.get('fused', True), collapse=manifest.get('collapse', False),
+                                directed=manifest.get('directed', True), store=wheel_store_from_environment(),
+                                expansion=expansion, writer=writer)
+    except Exception:
+        # a network that failed halfway is not left behind as if it were complete
+        if os.path.exists(manifest['output']):
+            os.remove(manifest['output'])
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build NetR networks from JSON manifests without the GUI")
+    parser.add_argument('manifests', nargs='+', help="manifest files describing the networks to build")
+    parser.add_argument('--report', help="write a JSON report of where the run spent its time to this file")
+    args = parser.parse_args(argv)
+
+    if args.report:
+        enable(args.report)
+
+    failures = 0
+    for path in args.manifests:
+        for manifest in load_manifests(path):
+            try:
+                edges = build_network(manifest)
+                print("{}: {} edges".format(manifest['output'], edges))
+            except Exception as error:
+                # one broken network should not stop the rest of the batch
+                failures += 1
+                print("{}: failed - {!r}".format(manifest['output'], error), file=sys.stderr)
+
+    print("InterMine cache: {hits} hits, {misses} misses".format(**cache.stats()))
+    report_path = write_report()
+    if report_path:
+        print("Run report written to {}".format(report_path))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
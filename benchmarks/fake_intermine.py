@@ -0,0 +1,253 @@
+"""
+    A local stand-in for an InterMine webservice
+    It serves a small genomic data model, LOOKUP queries and row results from generated fixture data, so that NetR and
+    AttR can be run and timed without contacting a live mine. The amount of data is set by the number of genes, the
+    number of interactions per gene and the number of synonyms per gene"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import product
+from urllib.parse import parse_qs, urlparse
+import json
+import random
+import threading
+import xml.etree.ElementTree as ElementTree
+
+ORGANISM = 'Drosophila melanogaster'
+
+INTERACTION_TYPES = ('physical', 'genetic')
+
+MODEL_XML = """<model name="genomic" package="org.intermine.model.bio">
+<class name="Gene" is-interface="true">
+    <attribute name="primaryIdentifier" type="java.lang.String"/>
+    <attribute name="secondaryIdentifier" type="java.lang.String"/>
+    <attribute name="symbol" type="java.lang.String"/>
+    <reference name="organism" referenced-type="Organism"/>
+    <collection name="synonyms" referenced-type="Synonym"/>
+    <collection name="crossReferences" referenced-type="CrossReference"/>
+    <collection name="interactions" referenced-type="Interaction" reverse-reference="participant1"/>
+</class>
+<class name="Organism" is-interface="true">
+    <attribute name="name" type="java.lang.String"/>
+</class>
+<class name="Synonym" is-interface="true">
+    <attribute name="value" type="java.lang.String"/>
+</class>
+<class name="CrossReference" is-interface="true">
+    <attribute name="identifier" type="java.lang.String"/>
+</class>
+<class name="Interaction" is-interface="true">
+    <reference name="participant1" referenced-type="Gene" reverse-reference="interactions"/>
+    <reference name="participant2" referenced-type="Gene"/>
+    <collection name="details" referenced-type="InteractionDetail"/>
+</class>
+<class name="InteractionDetail" is-interface="true">
+    <attribute name="type" type="java.lang.String"/>
+</class>
+</model>
+"""
+
+
+class Gene:
+    def __init__(self, number):
+        self.primaryIdentifier = 'FBgn{:07d}'.format(number)
+        self.secondaryIdentifier = 'CG{:05d}'.format(number)
+        self.symbol = 'gene{}'.format(number)
+        self.synonyms = []
+        self.crossReferences = ['P{:05d}'.format(number)]
+        self.interactions = []
+
+
+def generate_genes(genes=1000, interactions=2.0, synonyms=3, seed=0):
+    """
+        Generates 'genes' genes with on average 'interactions' interactions and exactly 'synonyms' synonyms each.
+        Every gene's first synonym is an outdated identifier that LOOKUP resolves to the gene, and so is its
+        cross-reference, a UniProt-like accession that is not among its synonyms"""
+    generator = random.Random(seed)
+    population = [Gene(number) for number in range(genes)]
+
+    for gene in population:
+        gene.synonyms = ['{}-old{}'.format(gene.symbol, number) for number in range(synonyms)]
+        for _ in range(int(interactions) + (generator.random() < interactions % 1)):
+            gene.interactions.append((generator.choice(population), generator.choice(INTERACTION_TYPES)))
+
+    return population
+
+
+class FakeMine:
+    """
+        Serves the generated genes at http://127.0.0.1:<port>/service until stop() is called
+        Counts the number of queries answered and rows and bytes sent. Like a busy mine, it answers result queries with
+        HTTP 429 while 'capacity' of them are already running, and with HTTP 500 at the rate 'failures'"""
+
+    def __init__(self, genes=1000, interactions=2.0, synonyms=3, seed=0, organism=ORGANISM, port=0, latency=0.0,
+                 capacity=None, failures=0.0):
+        self.genes = generate_genes(genes, interactions, synonyms, seed)
+        self.organism = organism
+        self.latency = latency
+        self.capacity = capacity
+        self.failures = failures
+        self.queries = 0
+        self.rows = 0
+        self.bytes = 0
+        self.throttled = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.index = {}
+        for gene in self.genes:
+            for key in [gene.primaryIdentifier, gene.secondaryIdentifier, gene.symbol] + gene.synonyms + \
+                    gene.crossReferences:
+                self.index.setdefault(key, []).append(gene)
+
+        mine = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                mine.handle(self, parse_qs(urlparse(self.path).query))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                mine.handle(self, parse_qs(self.rfile.read(length).decode('utf8')))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = 'http://127.0.0.1:{}/service'.format(self.server.server_address[1])
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def handle(self, request, params):
+        path = urlparse(request.path).path
+        if path.endswith('/version/ws'):
+            self.send(request, '30', 'text/plain')
+        elif path.endswith('/model'):
+            self.send(request, MODEL_XML, 'application/xml')
+        elif path.endswith('/query/results'):
+            self.results(request, params)
+        else:
+            request.send_error(404)
+
+    def send(self, request, body, content_type):
+        body = body.encode('utf8')
+        request.send_response(200)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+        with self._lock:
+            self.bytes += len(body)
+
+    def results(self, request, params):
+        with self._lock:
+            if self.capacity is not None and self.in_flight >= self.capacity:
+                self.throttled += 1
+                status = 429
+            elif self._random.random() < self.failures:
+                self.failed += 1
+                status = 500
+            else:
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                status = 200
+        if status != 200:
+            request.send_error(status)
+            return
+
+        try:
+            self.answer(request, params)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def answer(self, request, params):
+        if self.latency:
+            threading.Event().wait(self.latency)
+
+        query = ElementTree.fromstring(params['query'][0])
+        views = query.get('view').split()
+        outer = {join.get('path') for join in query.iter('join') if join.get('style') == 'OUTER'}
+        start = int(params.get('start', ['0'])[0])
+        size = params.get('size', [None])[0]
+
+        rows = self.run(views, list(query.iter('constraint')), outer)
+        rows = rows[start:start + int(size)] if size else rows[start:]
+
+        with self._lock:
+            self.queries += 1
+            self.rows += len(rows)
+
+        if params.get('format', ['json'])[0] == 'count':
+            self.send(request, str(len(rows)), 'text/plain')
+            return
+
+        lines = ['{"rootClass":"Gene","modelName":"genomic","start":%d,"views":%s,"results":['
+                 % (start, json.dumps(views))]
+        lines.extend(json.dumps(row) + (',' if number < len(rows) - 1 else '') for number, row in enumerate(rows))
+        lines.append('],"executionTime":"","wasSuccessful":true,"error":null,"statusCode":200}')
+        self.send(request, '\n'.join(lines) + '\n', 'application/json')
+
+    def run(self, views, constraints, outer):
+        genes = self.genes
+        for constraint in constraints:
+            if constraint.get('op') == 'LOOKUP':
+                matched = {}
+                for value in constraint.get('value').split(','):
+                    for gene in self.index.get(value.strip(), ()):
+                        matched[id(gene)] = gene
+                genes = [gene for gene in genes if id(gene) in matched]
+            elif constraint.get('path') == 'Gene.organism.name' and constraint.get('value') != self.organism:
+                genes = []
+
+        rows = []
+        for gene in genes:
+            rows.extend(self.gene_rows(gene, views, outer))
+        return rows
+
+    @staticmethod
+    def gene_rows(gene, views, outer):
+        synonyms = [None]
+        if any(view.startswith('Gene.synonyms.') for view in views):
+            synonyms = gene.synonyms or ([None] if 'Gene.synonyms' in outer else [])
+
+        interactions = [None]
+        if any(view.startswith('Gene.interactions.') for view in views):
+            interactions = gene.interactions or ([None] if 'Gene.interactions' in outer else [])
+
+        references = [None]
+        if any(view.startswith('Gene.crossReferences.') for view in views):
+            references = gene.crossReferences
+
+        rows = []
+        for synonym, reference, interaction in product(synonyms, references, interactions):
+            row = []
+            for view in views:
+                if view.startswith('Gene.synonyms.'):
+                    row.append(synonym)
+                elif view.startswith('Gene.crossReferences.'):
+                    row.append(reference)
+                elif view == 'Gene.interactions.details.type':
+                    row.append(interaction[1] if interaction else None)
+                elif view.startswith('Gene.interactions.participant2.'):
+                    row.append(getattr(interaction[0], view.rsplit('.', 1)[1]) if interaction else None)
+                else:
+                    row.append(getattr(gene, view.rsplit('.', 1)[1]))
+            rows.append(row)
+        return rows
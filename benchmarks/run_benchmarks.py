@@ -0,0 +1,175 @@
+"""
+    Times the NetR and AttR pipelines against a local FakeMine
+
+    Usage:
+        python benchmarks/run_benchmarks.py [--sizes 1000 10000 100000] [--repeat 3] [--output results.json]
+                                            [--compare baseline.json]
+
+    For every size, a mine with that many genes is started and the stages below are timed on that many IDs (a mix of
+    primary identifiers, secondary identifiers, symbols and outdated synonyms):
+
+        Wheel.update_core, Wheel.update_primaries, Wheel.get_secondaries - one wheel, querying on its own
+        make_network - the same IDs split over several wheels, with interaction data
+        AttR.create_node_dataframe, AttR.make_attribute_table - on the network made by make_network
+
+    The InterMine cache is emptied before every run, so each stage always talks to the mine. The best time of the
+    repeats is reported. With --compare, stages that are slower than the baseline by more than --tolerance are listed
+    and the exit status is 1"""
+
+import os
+import sys
+
+# the lookup cache and the saved models would turn every repeat into a cache hit
+os.environ.setdefault('NETRATTR_CACHE', 'off')
+os.environ.setdefault('NETRATTR_MODEL_DIR', 'off')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_intermine import FakeMine, ORGANISM
+from netr_core import Network, Wheel, make_network
+import AttR
+import argparse
+import intermine_utils
+import json
+import pandas as pd
+import time
+
+WHEELS = 4
+
+
+def sample_ids(mine, size):
+    """Returns 'size' IDs of the mine's genes, cycling through the kinds of identifier LOOKUP accepts"""
+    ids = []
+    for number, gene in enumerate(mine.genes[:size]):
+        kind = number % 4
+        if kind == 0:
+            ids.append(gene.primaryIdentifier)
+        elif kind == 1:
+            ids.append(gene.secondaryIdentifier)
+        elif kind == 2 and gene.synonyms:
+            ids.append(gene.synonyms[0])
+        else:
+            ids.append(gene.symbol)
+    return ids
+
+
+def make_wheel(ids, core, name='benchmark', download=True):
+    return Wheel({'dataset_name': name, 'organism': ORGANISM, 'core': core, 'technique': 'benchmark',
+                  'ids': ids, 'download': download})
+
+
+def make_benchmark_network(ids, core):
+    network = Network(True)
+    size = -(-len(ids) // WHEELS)
+    for number in range(WHEELS):
+        network.append(make_wheel(ids[number * size:(number + 1) * size], core, 'dataset {}'.format(number)))
+    return network
+
+
+def make_attr(netr_dataframe, ids):
+    attr = AttR.AttR(gui=False)
+    attr.info['NetR DataFrame'] = netr_dataframe
+    attr.info['Organism'] = ORGANISM
+
+    symbols = intermine_utils.lookup_frame(ids[::2], ORGANISM, ['symbol'], categorical=['symbol'])['symbol']
+    attr.info['List Attributes'].append(symbols.rename('benchmark list'))
+    attr.info['Discrete and Continuous Attributes'].append(pd.DataFrame({'Mapping Key': symbols.unique(),
+                                                                         'score': range(symbols.nunique())}))
+    attr.create_node_dataframe()
+    return attr
+
+
+def stages(ids):
+    """Yields (name, setup, stage) for each timed stage; setup runs untimed before stage"""
+    core = ids[0]
+
+    def wheel():
+        return make_wheel(ids, core)
+
+    yield 'Wheel.update_core', wheel, lambda subject: subject.update_core()
+    yield 'Wheel.update_primaries', wheel, lambda subject: subject.update_primaries()
+    yield 'Wheel.get_secondaries', wheel, lambda subject: subject.get_secondaries()
+    yield 'make_network', lambda: make_benchmark_network(ids, core), make_network
+
+    netr_dataframe = make_network(make_benchmark_network(ids, core))
+
+    def attr():
+        subject = AttR.AttR(gui=False)
+        subject.info['NetR DataFrame'] = netr_dataframe
+        subject.info['Organism'] = ORGANISM
+        return subject
+
+    yield 'AttR.create_node_dataframe', attr, lambda subject: subject.create_node_dataframe()
+    yield 'AttR.make_attribute_table', lambda: make_attr(netr_dataframe, ids), \
+        lambda subject: (subject.make_attribute_table(export=False), subject.attribute_table())
+
+
+def time_stage(mine, setup, stage, repeat):
+    best = None
+    for _ in range(repeat):
+        intermine_utils.cache.clear()
+        subject = setup()
+        queries, rows = mine.queries, mine.rows
+        start = time.perf_counter()
+        stage(subject)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best['seconds']:
+            best = {'seconds': elapsed, 'queries': mine.queries - queries, 'rows': mine.rows - rows}
+    return best
+
+
+def run(sizes, repeat, interactions=2.0, synonyms=3):
+    results = {}
+    for size in sizes:
+        with FakeMine(genes=size, interactions=interactions, synonyms=synonyms) as mine:
+            intermine_utils.service_urls[ORGANISM] = mine.url
+            ids = sample_ids(mine, size)
+            for name, setup, stage in stages(ids):
+                result = time_stage(mine, setup, stage, repeat)
+                results.setdefault(str(size), {})[name] = result
+                print("{:>8} IDs  {:<28} {:>9.3f} s  {:>5} queries  {:>8} rows".format(
+                    size, name, result['seconds'], result['queries'], result['rows']), flush=True)
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    """Returns the stages that are more than 'tolerance' times slower than in the baseline"""
+    slower = []
+    for size, timings in results.items():
+        for name, result in timings.items():
+            reference = baseline.get(size, {}).get(name)
+            if reference and result['seconds'] > reference['seconds'] * tolerance:
+                slower.append((size, name, reference['seconds'], result['seconds']))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time NetR and AttR against a local InterMine stand-in")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="numbers of IDs to benchmark with")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage; the best one is reported")
+    parser.add_argument('--interactions', type=float, default=2.0, help="average interactions per gene")
+    parser.add_argument('--synonyms', type=int, default=3, help="synonyms per gene")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help="slowdown relative to the baseline that counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat, args.interactions, args.synonyms)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            slower = regressions(results, json.load(baseline_file), args.tolerance)
+        for size, name, before, after in slower:
+            print("regression: {} at {} IDs took {:.3f} s (baseline {:.3f} s)".format(name, size, after, before),
+                  file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+    Measures how long NetR and AttR take to show their window
+
+    Usage:
+        python benchmarks/startup_time.py [--repeat 5] [--budget 1.0] [--output startup.json]
+
+    Every measurement runs in a fresh interpreter, so nothing is imported yet. It reports the time to import the GUI
+    module and, when a display is available, the time until its window is drawn (both from the first import of
+    startup.py), the wall time of the whole process and the heavy modules that were already imported when the window
+    came up. The best time of the repeats is reported.
+
+    The exit status is 1 when the window (or, without a display, the import) takes longer than --budget seconds (by
+    default startup.STARTUP_BUDGET), or when a heavy module is imported before the window is shown"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from startup import STARTUP_BUDGET
+import argparse
+import json
+import subprocess
+import time
+
+HEAVY_MODULES = ('pandas', 'numpy', 'intermine.webservice', 'pyarrow', 'intermine_utils', 'netr_core')
+
+# run in a fresh interpreter for every measurement; prints the measurement as JSON
+MEASURE = '''
+import json, sys, time
+import startup
+import {module} as gui_module
+
+measurement = {{'import seconds': time.perf_counter() - startup.STARTED, 'window seconds': None}}
+
+
+class Controller:
+    info = {{}}
+    handed_over = False
+
+    @staticmethod
+    def reset():
+        pass
+
+
+def shown():
+    measurement['window seconds'] = startup.window_shown()
+    window.destroy()
+
+
+try:
+    window = gui_module.GUI(Controller())
+    window.after_idle(shown)
+    window.mainloop()
+except gui_module.tk.TclError:
+    # no display
+    pass
+
+measurement['heavy modules'] = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps(measurement))
+'''
+
+
+def measure(module):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', MEASURE.format(module=module, heavy=HEAVY_MODULES)], cwd=ROOT,
+                            check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    measurement = json.loads(output.strip().splitlines()[-1])
+    measurement['process seconds'] = time.perf_counter() - start
+    return measurement
+
+
+def run(repeat):
+    results = {}
+    for module in ('NetR', 'AttR'):
+        best = None
+        for _ in range(repeat):
+            measurement = measure(module)
+            if best is None or measurement['process seconds'] < best['process seconds']:
+                best = measurement
+        results[module] = best
+
+        window = best['window seconds']
+        print("{:<5} import {:.3f} s  window {}  process {:.3f} s  heavy modules: {}".format(
+            module, best['import seconds'], 'n/a' if window is None else '{:.3f} s'.format(window),
+            best['process seconds'], ', '.join(best['heavy modules']) or 'none'), flush=True)
+    return results
+
+
+def over_budget(results, budget):
+    """Returns a description of every GUI that misses the budget"""
+    problems = []
+    for module, result in results.items():
+        seconds = result['window seconds'] if result['window seconds'] is not None else result['import seconds']
+        if seconds > budget:
+            problems.append("{} took {:.3f} s to start (budget {:.3f} s)".format(module, seconds, budget))
+        if result['heavy modules']:
+            problems.append("{} imported {} before its window was shown".format(
+                module, ', '.join(result['heavy modules'])))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the startup time of the NetR and AttR windows")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per GUI; the best one is reported")
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET, help="startup time budget in seconds")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    problems = over_budget(results, args.budget)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
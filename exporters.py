@@ -0,0 +1,441 @@
+"""
+    Writers for NetR networks and AttR attribute tables
+    The format is chosen from the extension of the output path: .csv, .csv.gz (gzip-compressed CSV), .parquet, .arrow
+    (Arrow IPC file), .graphml and .cx (Cytoscape CX JSON). All of them keep the columns of the CSV output, so existing
+    Cytoscape import mappings keep working; in GraphML and CX every column is an edge attribute and the nodes carry
+    their primary identifier, secondary identifier and symbol. Parquet and Arrow need the optional pyarrow package.
+
+    Writers take a frame at a time with append() and stream its rows to the file, without building a converted copy of
+    the whole table first. read_network_ids reads the primary identifiers of the nodes back from a network saved in
+    any of these formats, for AttR"""
+
+from instrumentation import count, timed
+from pandas.api.types import is_bool_dtype, is_float_dtype, is_integer_dtype
+from xml.sax.saxutils import escape, quoteattr
+import gzip
+import json
+import os
+import pandas as pd
+import xml.etree.ElementTree as ElementTree
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    # Parquet and Arrow output are only offered when pyarrow is installed
+    pa = None
+
+NODE_ATTRIBUTES = ['Primary Identifier', 'Secondary Identifier', 'Symbol']
+
+# the columns of the edge table with the primary identifiers of both ends; they are its first and seventh column
+ID_COLUMNS = ['Source Primary Identifier', 'Target Primary Identifier']
+ID_POSITIONS = [0, 6]
+
+GRAPHML_NODE = '{http://graphml.graphdrawing.org/xmlns}node'
+GRAPHML_EDGE = '{http://graphml.graphdrawing.org/xmlns}edge'
+# id of the placeholder node of an unknown edge end in the graph formats
+PLACEHOLDER = 'unresolved {}'
+
+
+def _missing(value):
+    return value is None or value != value
+
+
+class FrameWriter:
+    """Base class of the writers; used as a context manager, the file is closed when the block is left"""
+
+    graph = False
+
+    def __init__(self, path, index=False):
+        self.path = path
+        self.index = index
+        self.rows = 0
+
+    @timed('write output')
+    def append(self, frame):
+        self.write(frame)
+        self.rows += frame.shape[0]
+        count('rows written', frame.shape[0])
+        return self
+
+    def write(self, frame):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CSVWriter(FrameWriter):
+    """Writes CSV, gzip-compressed when the path ends in .gz. The header is written with the first frame"""
+
+    def __init__(self, path, index=False):
+        FrameWriter.__init__(self, path, index)
+        if path.lower().endswith('.gz'):
+            self.file = gzip.open(path, 'wt', newline='')
+        else:
+            self.file = open(path, 'w', newline='')
+        self.header = True
+
+    def write(self, frame):
+        frame.to_csv(self.file, index=self.index, header=self.header)
+        self.header = False
+
+    def close(self):
+        self.file.close()
+
+
+class ArrowWriter(FrameWriter):
+    """
+        Writes an Arrow IPC file. The IPC file format allows one dictionary per column for the whole file, while every
+        appended frame has categories of its own, so categorical columns are written as plain strings"""
+
+    dictionaries = False
+
+    def __init__(self, path, index=False):
+        if pa is None:
+            raise ValueError("Writing {} requires the pyarrow package (pip install pyarrow)".format(
+                os.path.basename(path)))
+        FrameWriter.__init__(self, path, index)
+        self.schema = None
+        self.writer = None
+
+    def stream_type(self, data_type):
+        # the schema is fixed by the first frame, so types that depend on the rows of that frame are widened: the
+        # width of the dictionary codes depends on the number of categories, and a column without values has no type
+        if pa.types.is_dictionary(data_type):
+            value_type = self.stream_type(data_type.value_type)
+            return pa.dictionary(pa.int32(), value_type) if self.dictionaries else value_type
+        if pa.types.is_null(data_type):
+            return pa.string()
+        return data_type
+
+    def open(self, schema):
+        return pa.ipc.new_file(self.path, schema)
+
+    def write(self, frame):
+        if self.schema is None:
+            schema = pa.Schema.from_pandas(frame, preserve_index=self.index)
+            self.schema = pa.schema([field.with_type(self.stream_type(field.type)) for field in schema],
+                                    metadata=schema.metadata)
+            self.writer = self.open(self.schema)
+        self.writer.write_table(pa.Table.from_pandas(frame, schema=self.schema, preserve_index=self.index))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ParquetWriter(ArrowWriter):
+    """
+        Writes a Parquet file, one row group per appended frame. Categorical columns stay dictionary-encoded, so the
+        codes are written as they are instead of repeating every identifier"""
+
+    dictionaries = True
+
+    def open(self, schema):
+        return pa.parquet.ParquetWriter(self.path, schema)
+
+
+def _attribute_type(dtype):
+    if is_bool_dtype(dtype):
+        return 'boolean'
+    if is_integer_dtype(dtype):
+        return 'long'
+    if is_float_dtype(dtype):
+        return 'double'
+    return 'string'
+
+
+class GraphWriter(FrameWriter):
+    """
+        Base class of the graph formats. Nodes are identified by their primary identifier (or their secondary
+        identifier or symbol when they have none) and are written once, the first time an edge refers to them. An end
+        of an edge that is unknown (the core gene of a wheel that could not be resolved) is a placeholder node of its
+        own, without attributes, so the graph keeps every edge of the CSV output"""
+
+    graph = True
+
+    def __init__(self, path, directed=True):
+        FrameWriter.__init__(self, path)
+        self.directed = directed
+        self.file = open(path, 'w', encoding='utf8')
+        self.nodes = {}
+        self.names = []
+        self.edges = 0
+        self.placeholders = 0
+        self.columns = None
+
+    def node_columns(self, frame, end):
+        return [frame.columns.get_loc('{} {}'.format(end, name)) if '{} {}'.format(end, name) in frame else None
+                for name in NODE_ATTRIBUTES]
+
+    def node(self, row, positions):
+        """Returns the node of one end of the edge, writing it first if it was not seen before"""
+        values = [None if position is None or _missing(row[position]) else row[position] for position in positions]
+        name = next((value for value in values if value is not None), None)
+        if name is None:
+            # unknown ends are never the same node, since there is no telling whether they are the same gene
+            self.placeholders += 1
+            name = PLACEHOLDER.format(self.placeholders)
+            node = len(self.names)
+            self.names.append(name)
+            self.write_node(node, None, values)
+            return node
+        node = self.nodes.get(name)
+        if node is None:
+            node = self.nodes[name] = len(self.names)
+            self.names.append(name)
+            self.write_node(node, name, values)
+        return node
+
+    def write(self, frame):
+        if self.columns is None:
+            self.columns = [(str(name), _attribute_type(frame[name].dtype)) for name in frame.columns]
+            self.start()
+
+        sources, targets = self.node_columns(frame, 'Source'), self.node_columns(frame, 'Target')
+        for row in frame.itertuples(index=False, name=None):
+            self.write_edge(self.edges, self.node(row, sources), self.node(row, targets), row)
+            self.edges += 1
+        self.flush()
+
+    def start(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.columns is None:
+            self.columns = []
+            self.start()
+        self.finish()
+        self.file.close()
+
+
+class GraphMLWriter(GraphWriter):
+    """Writes GraphML, with a key per node attribute and per column of the edge table"""
+
+    @staticmethod
+    def text(value, attribute_type):
+        if attribute_type == 'boolean':
+            return 'true' if value else 'false'
+        return escape(str(value))
+
+    def start(self):
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                        '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        for position, name in enumerate(NODE_ATTRIBUTES):
+            self.file.write('  <key id="n{}" for="node" attr.name={} attr.type="string"/>\n'.format(
+                position, quoteattr(name)))
+        for position, (name, attribute_type) in enumerate(self.columns):
+            self.file.write('  <key id="e{}" for="edge" attr.name={} attr.type="{}"/>\n'.format(
+                position, quoteattr(name), attribute_type))
+        self.file.write('  <graph id="G" edgedefault="{}">\n'.format('directed' if self.directed else 'undirected'))
+
+    def write_node(self, node, name, values):
+        data = ''.join('<data key="n{}">{}</data>'.format(position, escape(str(value)))
+                       for position, value in enumerate(values) if value is not None)
+        self.file.write('    <node id={}>{}</node>\n'.format(quoteattr(str(self.names[node])), data))
+
+    def write_edge(self, edge, source, target, row):
+        data = ''.join('<data key="e{}">{}</data>'.format(position, self.text(value, self.columns[position][1]))
+                       for position, value in enumerate(row) if not _missing(value))
+        self.file.write('    <edge source={} target={}>{}</edge>\n'.format(
+            quoteattr(str(self.names[source])), quoteattr(str(self.names[target])), data))
+
+    def finish(self):
+        self.file.write('  </graph>\n</graphml>\n')
+
+
+class CXWriter(GraphWriter):
+    """
+        Writes Cytoscape CX (version 1) JSON. The nodes, edges and their attributes of every appended frame are written
+        as aspect fragments of their own, and the element counts follow in the closing metadata"""
+
+    ASPECTS = ['nodes', 'edges', 'nodeAttributes', 'edgeAttributes', 'networkAttributes']
+
+    CX_TYPES = {'boolean': 'boolean', 'long': 'long', 'double': 'double'}
+
+    def start(self):
+        names = [name for name, attribute_type in self.columns]
+        self.interaction = names.index('Interaction') if 'Interaction' in names else None
+        self.fragments = {aspect: [] for aspect in self.ASPECTS}
+        self.node_attributes = 0
+        self.edge_attributes = 0
+        self.file.write('[{"numberVerification": [{"longNumber": 281474976710655}]},\n')
+        self.aspect('metaData', [{'name': aspect, 'version': '1.0', 'consistencyGroup': 1}
+                                 for aspect in self.ASPECTS])
+        self.aspect('networkAttributes', [
+            {'n': 'name', 'v': os.path.splitext(os.path.basename(self.path))[0]},
+            {'n': 'directed', 'v': self.directed, 'd': 'boolean'}])
+
+    def aspect(self, name, elements):
+        if elements:
+            json.dump({name: elements}, self.file)
+            self.file.write(',\n')
+
+    def write_node(self, node, name, values):
+        if name is None:
+            # placeholders have no represents, which tells them apart from nodes named after their symbol
+            self.fragments['nodes'].append({'@id': node, 'n': self.names[node]})
+            return
+        self.fragments['nodes'].append({'@id': node, 'n': values[2] if values[2] is not None else name, 'r': name})
+        for attribute, value in zip(NODE_ATTRIBUTES, values):
+            if value is not None:
+                self.fragments['nodeAttributes'].append({'po': node, 'n': attribute, 'v': str(value)})
+
+    def write_edge(self, edge, source, target, row):
+        interaction = row[self.interaction] if self.interaction is not None else None
+        self.fragments['edges'].append({'@id': edge, 's': source, 't': target,
+                                        'i': None if _missing(interaction) else str(interaction)})
+        for (name, attribute_type), value in zip(self.columns, row):
+            if not _missing(value):
+                attribute = {'po': edge, 'n': name}
+                if attribute_type in self.CX_TYPES:
+                    attribute['v'] = value.item() if hasattr(value, 'item') else value
+                    attribute['d'] = self.CX_TYPES[attribute_type]
+                else:
+                    attribute['v'] = str(value)
+                self.fragments['edgeAttributes'].append(attribute)
+
+    def flush(self):
+        self.node_attributes += len(self.fragments['nodeAttributes'])
+        self.edge_attributes += len(self.fragments['edgeAttributes'])
+        for aspect in self.ASPECTS:
+            self.aspect(aspect, self.fragments[aspect])
+            self.fragments[aspect] = []
+
+    def finish(self):
+        counts = {'nodes': len(self.names), 'edges': self.edges, 'nodeAttributes': self.node_attributes,
+                  'edgeAttributes': self.edge_attributes, 'networkAttributes': 2}
+        metadata = []
+        for aspect in self.ASPECTS:
+            element = {'name': aspect, 'elementCount': counts[aspect]}
+            if aspect in ('nodes', 'edges'):
+                element['idCounter'] = max(counts[aspect] - 1, 0)
+            metadata.append(element)
+        self.aspect('metaData', metadata)
+        self.file.write('{"status": [{"error": "", "success": true}]}]\n')
+
+
+# extension -> (description, writer); the longest matching extension wins, so .csv.gz is not taken for .gz
+FORMATS = {
+    '.csv': ("CSV", CSVWriter),
+    '.csv.gz': ("Compressed CSV", CSVWriter),
+    '.parquet': ("Parquet", ParquetWriter),
+    '.arrow': ("Arrow IPC", ArrowWriter),
+    '.graphml': ("GraphML", GraphMLWriter),
+    '.cx': ("Cytoscape CX", CXWriter),
+}
+
+
+def output_format(path):
+    """Returns the extension of FORMATS that 'path' ends with; paths with any other extension are written as CSV"""
+    matches = [extension for extension in FORMATS if path.lower().endswith(extension)]
+    return max(matches, key=len) if matches else '.csv'
+
+
+def filetypes(graph=True):
+    """File types for the save dialogs of tkinter.filedialog"""
+    return [(description, '*' + extension) for extension, (description, writer) in FORMATS.items()
+            if (graph or not writer.graph) and (pa is not None or not issubclass(writer, ArrowWriter))]
+
+
+def sibling_path(path, suffix):
+    """Returns 'path' with 'suffix' added before the extension of its format (x.csv.gz -> x_lists.csv.gz)"""
+    extension = output_format(path)
+    if not path.lower().endswith(extension):
+        extension = os.path.splitext(path)[1]
+    return path[:len(path) - len(extension)] + suffix + path[len(path) - len(extension):]
+
+
+def network_writer(path, directed=True):
+    """Returns the writer of an edge table for the format of 'path'"""
+    writer = FORMATS[output_format(path)][1]
+    return writer(path, directed) if writer.graph else writer(path)
+
+
+def table_writer(path, index=False):
+    """Returns the writer of an attribute table for the format of 'path'. Graph formats need an edge table"""
+    writer = FORMATS[output_format(path)][1]
+    if writer.graph:
+        raise ValueError("Attribute tables cannot be written as {}; choose a table format such as CSV or "
+                         "Parquet".format(FORMATS[output_format(path)][0]))
+    return writer(path, index)
+
+
+def write_network(master_dataframe, path, directed=True):
+    with network_writer(path, directed) as writer:
+        writer.append(master_dataframe)
+    return path
+
+
+def write_table(table, path, index=True):
+    with table_writer(path, index) as writer:
+        writer.append(table)
+    return path
+
+
+def _read_csv_ids(path):
+    return pd.read_csv(path, usecols=ID_POSITIONS, dtype=str)
+
+
+def _read_arrow_ids(path, table):
+    if pa is None:
+        raise ValueError("Reading {} requires the pyarrow package (pip install pyarrow)".format(
+            os.path.basename(path)))
+    return table().select(ID_POSITIONS).to_pandas()
+
+
+def _read_graphml_ids(path):
+    # the ends of an edge refer to the ids of its nodes, which are their primary identifiers (see GraphWriter).
+    # Placeholders are the nodes without any data
+    placeholders = set()
+    ends = []
+    for event, element in ElementTree.iterparse(path):
+        if element.tag == GRAPHML_NODE:
+            if len(element) == 0:
+                placeholders.add(element.get('id'))
+            element.clear()
+        elif element.tag == GRAPHML_EDGE:
+            ends.append(tuple(None if end in placeholders else end
+                              for end in (element.get('source'), element.get('target'))))
+            element.clear()
+    return pd.DataFrame(ends, columns=ID_COLUMNS, dtype=object)
+
+
+def _read_cx_ids(path):
+    with open(path, encoding='utf8') as cx_file:
+        fragments = json.load(cx_file)
+    names = {}
+    edges = []
+    for fragment in fragments:
+        for node in fragment.get('nodes', ()):
+            names[node['@id']] = node.get('r')
+        edges.extend(fragment.get('edges', ()))
+    return pd.DataFrame([(names[edge['s']], names[edge['t']]) for edge in edges], columns=ID_COLUMNS, dtype=object)
+
+
+def read_network_ids(path):
+    """
+        Returns the source and target primary identifiers of every edge of a network saved by NetR, in any of the
+        FORMATS. In the graph formats a node without a primary identifier is named after its secondary identifier or
+        symbol, and the unknown ends of edges are missing, as in the CSV output"""
+    extension = output_format(path)
+    if extension == '.parquet':
+        return _read_arrow_ids(path, lambda: pa.parquet.read_table(path))
+    if extension == '.arrow':
+        return _read_arrow_ids(path, lambda: pa.ipc.open_file(path).read_all())
+    if extension == '.graphml':
+        return _read_graphml_ids(path)
+    if extension == '.cx':
+        return _read_cx_ids(path)
+    return _read_csv_ids(path)
@@ -0,0 +1,218 @@
+"""
+    Timers and counters for the hot paths of NetR and AttR, written out as a JSON run report
+    Instrumentation is off unless the NETRATTR_REPORT environment variable names a report file, or enable() is called
+    (NetR_batch.py does so for --report). When it is off, timed functions call straight through and count/observe
+    return immediately"""
+
+from contextlib import contextmanager
+from functools import wraps
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+
+class RunReport:
+    """Accumulates the time spent in each stage, counters and value distributions (e.g. rows per query)"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+        self.distributions = {}
+        self._lock = threading.Lock()
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0})
+            stage['calls'] += 1
+            stage['seconds'] += seconds
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        with self._lock:
+            distribution = self.distributions.setdefault(name, {'count': 0, 'total': 0, 'min': value, 'max': value})
+            distribution['count'] += 1
+            distribution['total'] += value
+            distribution['min'] = min(distribution['min'], value)
+            distribution['max'] = max(distribution['max'], value)
+
+    def to_dict(self):
+        from intermine_utils import cache, mine_stats
+
+        with self._lock:
+            distributions = {name: dict(values, mean=values['total'] / values['count'])
+                             for name, values in self.distributions.items()}
+            return {
+                'command': sys.argv,
+                'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                'wall seconds': time.time() - self.started,
+                'peak memory bytes': peak_memory(),
+                'cache': cache.stats(),
+                'mines': mine_stats(),
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'counters': dict(self.counters),
+                'distributions': distributions,
+            }
+
+    def write(self, path=None):
+        path = path or self.path
+        if path:
+            with open(path, 'w') as report_file:
+                json.dump(self.to_dict(), report_file, indent=2)
+        return path
+
+
+def peak_memory():
+    """Peak resident memory of the process in bytes, or None where it cannot be measured"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+_report = None
+
+
+def enabled():
+    return _report is not None
+
+
+def enable(path=None):
+    """Starts a new run report; it is written to 'path' by write_report"""
+    global _report
+    _report = RunReport(path)
+    return _report
+
+
+def disable():
+    global _report
+    _report = None
+
+
+def report():
+    return _report
+
+
+def write_report(path=None):
+    """Writes the current run report, if instrumentation is on, and returns its path"""
+    if _report is not None:
+        return _report.write(path)
+
+
+def count(name, value=1):
+    if _report is not None:
+        _report.count(name, value)
+
+
+def observe(name, value):
+    if _report is not None:
+        _report.observe(name, value)
+
+
+@contextmanager
+def timer(name):
+    if _report is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _report.add_time(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator that adds the time spent in every call of the function to the stage 'name'"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _report is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _report.add_time(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class CountingResponse:
+    """Wraps an HTTP response and counts the bytes read from it as 'bytes received'"""
+
+    def __init__(self, response):
+        self.response = response
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self.response)
+        count('bytes received', len(line))
+        return line
+
+    def read(self, *args):
+        content = self.response.read(*args)
+        count('bytes received', len(content))
+        return content
+
+    def readline(self, *args):
+        line = self.response.readline(*args)
+        count('bytes received', len(line))
+        return line
+
+    def close(self):
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+
+class CountingOpener:
+    """Wraps the URL opener of an InterMine Service so that responses are counted while instrumentation is on"""
+
+    def __init__(self, opener):
+        self.opener = opener
+
+    def open(self, *args, **kwargs):
+        response = self.opener.open(*args, **kwargs)
+        if _report is None:
+            return response
+        count('requests')
+        return CountingResponse(response)
+
+    def read(self, url, data=None):
+        response = self.open(url, data)
+        try:
+            content = response.read()
+        finally:
+            response.close()
+        return content.decode('utf8') if isinstance(content, bytes) else content
+
+    def __getattr__(self, name):
+        return getattr(self.opener, name)
+
+
+if os.environ.get('NETRATTR_REPORT'):
+    enable(os.environ['NETRATTR_REPORT'])
+    atexit.register(write_report)
@@ -0,0 +1,876 @@
+"""
+    Shared InterMine access layer for NetR and AttR
+    Lookups go through a persistent on-disk cache keyed by (organism, mine URL, selected view paths, ID), so IDs that
+    were resolved in an earlier run (or earlier in the same run) are not requested from the mine again. One Service
+    per mine is kept for the whole process, and its data model can be persisted to disk"""
+
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from instrumentation import CountingOpener, count, observe, timed, timer
+from intermine.model import Model, ModelError
+from intermine.webservice import Service
+from itertools import islice
+from mines import service_urls
+from pandas.api.types import union_categoricals
+import hashlib
+import json
+import numpy as np
+import os
+import pandas as pd
+import random
+import sqlite3
+import threading
+import time
+
+# the fields LOOKUP matches on directly; they are used to attribute result rows back to the submitted IDs
+KEY_FIELDS = ('primaryIdentifier', 'secondaryIdentifier', 'symbol')
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.netrattr')
+
+# large ID lists are resolved in chunks, running as many chunks at a time as the mine accepts (see MineController); at
+# most MAX_WORKERS datasets are resolved at a time. The first chunks have CHUNK_SIZE IDs, later ones the chunk size the
+# mine's controller settled on. A chunk that fails because the mine is overloaded or unreachable is retried up to
+# MAX_RETRIES times, waiting about RETRY_DELAY seconds (doubled after every attempt, with random jitter) in between
+CHUNK_SIZE = int(os.environ.get('NETRATTR_CHUNK_SIZE', 500))
+MAX_WORKERS = int(os.environ.get('NETRATTR_WORKERS', 4))
+MAX_RETRIES = int(os.environ.get('NETRATTR_RETRIES', 3))
+RETRY_DELAY = float(os.environ.get('NETRATTR_RETRY_DELAY', 1))
+
+# result rows are turned into columns PAGE_SIZE rows at a time
+PAGE_SIZE = 10000
+
+# no more than MINE_CONCURRENCY requests are sent to the same mine at a time, however many wheels or chunks are being
+# resolved concurrently. Within that, every mine gets as many concurrent requests, and chunks as large (between
+# MIN_CHUNK_SIZE and MAX_CHUNK_SIZE IDs), as it sustains. NETRATTR_ADAPTIVE=off sends MINE_CONCURRENCY requests of
+# CHUNK_SIZE IDs instead
+MINE_CONCURRENCY = int(os.environ.get('NETRATTR_MINE_CONCURRENCY', 8))
+ADAPTIVE = os.environ.get('NETRATTR_ADAPTIVE', 'on').lower() not in ('off', 'none', '0', '')
+INITIAL_CONCURRENCY = 2
+MIN_CHUNK_SIZE = 50
+MAX_CHUNK_SIZE = int(os.environ.get('NETRATTR_MAX_CHUNK_SIZE', 2000))
+CHUNK_STEP = 100
+
+# a mine counts as congested when a query takes longer than TARGET_LATENCY seconds; chunks only grow while queries take
+# less than half of that
+TARGET_LATENCY = float(os.environ.get('NETRATTR_TARGET_LATENCY', 10))
+
+# after BREAKER_THRESHOLD failed requests in a row, a mine gets no requests for BREAKER_COOLDOWN seconds, doubled every
+# time it fails again; after BREAKER_MAX_TRIPS of these pauses, its lookups fail with MineUnavailable until the next
+# pause is over
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 5.0
+BREAKER_MAX_TRIPS = 5
+
+
+class PooledService(Service):
+    """
+        Service that is shared by every query to a mine
+        The data model is loaded lazily, only once, and is shared between threads. When 'model_dir' is given the model
+        XML and the webservice version are persisted there, so that a later cold start does not need to contact the
+        mine before results are actually requested"""
+
+    def __init__(self, root, model_dir=None, max_age=7 * 24 * 3600):
+        self.model_dir = model_dir
+        self.max_age = max_age
+        self._model_lock = threading.Lock()
+        self._persisted_version = self._read_persisted_version(root)
+        Service.__init__(self, root)
+        self._persist_version()
+
+    def _persisted_path(self, root, extension):
+        return os.path.join(self.model_dir, hashlib.sha256(root.encode('utf8')).hexdigest()[:16] + extension)
+
+    def _read_persisted_version(self, root):
+        if self.model_dir is None:
+            return None
+        try:
+            with open(self._persisted_path(root, '.json')) as version_file:
+                return json.load(version_file)['version']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _persist_version(self):
+        if self.model_dir is None or self._persisted_version is not None:
+            return
+        os.makedirs(self.model_dir, exist_ok=True)
+        with open(self._persisted_path(self.root, '.json'), 'w') as version_file:
+            json.dump({'root': self.root, 'version': self._version}, version_file)
+
+    @property
+    def opener(self):
+        return self._opener
+
+    @opener.setter
+    def opener(self, opener):
+        # Service.__init__ sets the opener; wrapping it lets the run report count the bytes received
+        self._opener = CountingOpener(opener)
+
+    @property
+    def version(self):
+        if self._version is None and self._persisted_version is not None:
+            self._version = self._persisted_version
+        return Service.version.fget(self)
+
+    @property
+    def model(self):
+        with self._model_lock:
+            if self._model is None:
+                self._model = self._load_model()
+        return self._model
+
+    def _load_model(self):
+        if self.model_dir is None:
+            return Model(self.root + self.MODEL_PATH, self)
+
+        path = self._persisted_path(self.root, '.xml')
+        if os.path.exists(path) and time.time() - os.path.getmtime(path) < self.max_age:
+            return Model(path, self)
+
+        try:
+            model_xml = self.opener.read(self.root + self.MODEL_PATH)
+        except OSError:
+            # the mine cannot be reached: fall back to the persisted model even if it is out of date
+            if os.path.exists(path):
+                return Model(path, self)
+            raise
+
+        os.makedirs(self.model_dir, exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf8') as model_file:
+            model_file.write(model_xml)
+        os.replace(path + '.tmp', path)
+
+        return Model(path, self)
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_service(organism):
+    """Returns the Service for the organism's mine, creating it on first use"""
+    url = service_urls[organism]
+    with _services_lock:
+        if url not in _services:
+            # NETRATTR_MODEL_DIR=off keeps the data model in memory only
+            model_dir = os.environ.get('NETRATTR_MODEL_DIR', os.path.join(CACHE_DIR, 'models'))
+            if model_dir.lower() in ('off', 'none', '0', ''):
+                model_dir = None
+            with timer('Service construction'):
+                _services[url] = PooledService(url, model_dir,
+                                               max_age=float(os.environ.get('NETRATTR_CACHE_TTL', 7 * 24 * 3600)))
+        return _services[url]
+
+
+@timed('intermine_query')
+def intermine_query(ids, organism, *args, outer_joins=()):
+    service = get_service(organism)
+    query = service.new_query("Gene", case_sensitive=True)
+    query.add_constraint("Gene", "LOOKUP", ids, code="A")
+    query.add_constraint("organism.name", "=", organism, code="B")
+    query.select(*args)
+    for path in outer_joins:
+        query.outerjoin(path)
+    return query
+
+
+class QueryCache:
+    """
+        Content-addressed cache of InterMine lookup results stored in SQLite
+        Entries expire after 'ttl' seconds and the least recently used entries are evicted once the cache grows beyond
+        'max_bytes'. Hits and misses are counted for the lifetime of the object"""
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_bytes=512 * 1024 ** 2):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS lookups (key TEXT PRIMARY KEY, value BLOB, "
+                                     "size INTEGER, created REAL, accessed REAL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS lookups_accessed ON lookups (accessed)")
+        return self._connection
+
+    @staticmethod
+    def make_key(organism, url, views, gene_id, outer_joins=()):
+        key = [organism, url, list(views), gene_id]
+        if outer_joins:
+            key.append(sorted(outer_joins))
+        content = json.dumps(key)
+        return hashlib.sha256(content.encode('utf8')).hexdigest()
+
+    def get_many(self, keys):
+        """Returns a dictionary with the cached value of every key that is present and not expired"""
+        found = {}
+        now = time.time()
+        keys = list(keys)
+
+        with self._lock:
+            # SQLite limits the number of host parameters in a single statement
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self.connection.execute(
+                    "SELECT key, value, created FROM lookups WHERE key IN ({})".format(','.join('?' * len(batch))),
+                    batch).fetchall()
+
+                expired = [key for key, value, created in rows if now - created > self.ttl]
+                found.update((key, json.loads(value)) for key, value, created in rows if now - created <= self.ttl)
+
+                if expired:
+                    self.connection.executemany("DELETE FROM lookups WHERE key = ?", ((key,) for key in expired))
+
+            self.connection.executemany("UPDATE lookups SET accessed = ? WHERE key = ?",
+                                        ((now, key) for key in found))
+            self.connection.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        records = []
+        for key, value in items.items():
+            value = json.dumps(value)
+            records.append((key, value, len(value), now, now))
+
+        with self._lock:
+            self.connection.executemany("INSERT OR REPLACE INTO lookups VALUES (?, ?, ?, ?, ?)", records)
+            self._evict()
+            self.connection.commit()
+
+    def _evict(self):
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM lookups").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # drop the least recently used entries until the cache is back to 90% of its size limit
+        to_delete = []
+        for key, size in self.connection.execute("SELECT key, size FROM lookups ORDER BY accessed"):
+            if total <= self.max_bytes * 0.9:
+                break
+            to_delete.append((key,))
+            total -= size
+        self.connection.executemany("DELETE FROM lookups WHERE key = ?", to_delete)
+
+    def clear(self):
+        with self._lock:
+            self.connection.execute("DELETE FROM lookups")
+            self.connection.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM lookups").fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+
+def _cache_from_environment():
+    # NETRATTR_CACHE=off keeps lookups for the current run only
+    path = os.environ.get('NETRATTR_CACHE', os.path.join(CACHE_DIR, 'cache.sqlite'))
+    if path.lower() in ('off', 'none', '0', ''):
+        path = ':memory:'
+    return QueryCache(path,
+                      ttl=float(os.environ.get('NETRATTR_CACHE_TTL', 7 * 24 * 3600)),
+                      max_bytes=int(float(os.environ.get('NETRATTR_CACHE_SIZE_MB', 512)) * 1024 ** 2))
+
+
+cache = _cache_from_environment()
+
+
+def unique_ids(ids):
+    """Accepts a comma-separated string or an iterable of IDs and returns the distinct, stripped IDs in order"""
+    if isinstance(ids, str):
+        ids = ids.split(',')
+    unique = {}
+    for gene_id in ids:
+        if gene_id is None:
+            continue
+        gene_id = str(gene_id).strip()
+        if gene_id:
+            unique[gene_id] = None
+    return list(unique)
+
+
+class MineUnavailable(Exception):
+    """Raised by lookups to a mine that kept failing, once its circuit breaker gave up on it"""
+
+
+def http_status(error):
+    """The HTTP status code of a failed request, or None when the request got no response"""
+    status = getattr(error, 'code', None)
+    if isinstance(status, int):
+        return status
+    # WebserviceError carries the status among its arguments
+    for argument in getattr(error, 'args', ()):
+        if isinstance(argument, int):
+            return argument
+        if isinstance(argument, str) and argument.isdigit():
+            return int(argument)
+    return None
+
+
+def overloaded(error):
+    """
+        Whether a failed request means that the mine is overloaded or unreachable (HTTP 408, 429 and 5xx, timeouts and
+        dropped connections), rather than that the request itself was wrong"""
+    if not isinstance(error, OSError):
+        return False
+    status = http_status(error)
+    return status is None or status in (408, 429) or status >= 500
+
+
+class MineController:
+    """
+        Paces the requests to one mine
+        Concurrency and chunk size are tuned AIMD-style from every response: each fast answer adds to them, while a
+        throttled (429) or failed request, or one slower than TARGET_LATENCY, halves them. After BREAKER_THRESHOLD
+        failures in a row, the circuit breaker stops all requests to the mine for a cooldown, after which a single
+        request probes whether it has recovered"""
+
+    def __init__(self, url):
+        self.url = url
+        self.limit = float(INITIAL_CONCURRENCY if ADAPTIVE else MINE_CONCURRENCY)
+        self.chunk_size = CHUNK_SIZE
+        self.in_flight = 0
+        self.latency = None
+        self.last_decrease = 0.0
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.breaker_trips = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, progress=None):
+        with self._condition:
+            while True:
+                wait = self.open_until - time.monotonic()
+                if self.trips > BREAKER_MAX_TRIPS:
+                    if wait > 0:
+                        raise MineUnavailable("{} is not responding".format(self.url))
+                    # a later lookup tries the mine again
+                    self.trips = 0
+                if wait <= 0 and self.in_flight < max(1, int(self.limit)):
+                    self.in_flight += 1
+                    return
+                # waiting is interrupted regularly, so that a cancelled job does not wait for the breaker to close
+                self._condition.wait(min(wait, 0.5) if wait > 0 else 0.5)
+                if progress is not None:
+                    progress.check()
+
+    def release(self, seconds, ids=0, error=None):
+        with self._condition:
+            self.in_flight -= 1
+            self.requests += 1
+            if error is None:
+                self.succeeded(seconds, ids)
+            elif overloaded(error):
+                self.failed(error)
+            self._condition.notify_all()
+
+    @contextmanager
+    def request(self, ids=0, progress=None):
+        """Holds one of the mine's request slots; the response time and outcome of the block tune the controller"""
+        self.acquire(progress)
+        start = time.perf_counter()
+        error = None
+        try:
+            yield self
+        except BaseException as exception:
+            error = exception
+            raise
+        finally:
+            self.release(time.perf_counter() - start, ids, error)
+
+    @contextmanager
+    def slot(self, progress=None):
+        """
+            Holds one of the mine's request slots without tuning the controller, for requests that are not a chunk of
+            a lookup (e.g. the bulk download of a synonym index), whose response time says nothing about the mine"""
+        self.acquire(progress)
+        try:
+            yield self
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def decrease(self):
+        # the requests that were in flight together fail or slow down together; only the first of them counts
+        now = time.monotonic()
+        if now - self.last_decrease < (self.latency or 1.0):
+            return
+        self.last_decrease = now
+        self.limit = max(1.0, self.limit / 2)
+        self.chunk_size = max(MIN_CHUNK_SIZE, self.chunk_size // 2)
+        count('mine backoffs')
+
+    def succeeded(self, seconds, ids):
+        self.failures = 0
+        self.trips = 0
+        self.latency = seconds if self.latency is None else 0.8 * self.latency + 0.2 * seconds
+        if not ADAPTIVE:
+            # back from a circuit breaker probe
+            self.limit = float(MINE_CONCURRENCY)
+            return
+        if seconds > TARGET_LATENCY:
+            self.decrease()
+            return
+        self.limit = min(float(MINE_CONCURRENCY), self.limit + 1 / self.limit)
+        if ids >= self.chunk_size and seconds < TARGET_LATENCY / 2:
+            self.chunk_size = min(MAX_CHUNK_SIZE, self.chunk_size + CHUNK_STEP)
+
+    def failed(self, error):
+        if http_status(error) == 429:
+            self.throttled += 1
+            count('throttled requests')
+        else:
+            self.errors += 1
+            count('failed requests')
+        if ADAPTIVE:
+            self.decrease()
+
+        self.failures += 1
+        if self.failures >= BREAKER_THRESHOLD:
+            self.trips += 1
+            self.breaker_trips += 1
+            count('circuit breaker trips')
+            self.open_until = time.monotonic() + BREAKER_COOLDOWN * 2 ** (self.trips - 1)
+            # the request that probes the mine after the cooldown trips the breaker again if it fails as well
+            self.failures = BREAKER_THRESHOLD - 1
+            self.limit = 1.0
+
+    def stats(self):
+        with self._condition:
+            return {'concurrency': self.limit, 'chunk size': self.chunk_size, 'requests': self.requests,
+                    'throttled': self.throttled, 'errors': self.errors, 'circuit breaker trips': self.breaker_trips,
+                    'mean seconds per request': self.latency}
+
+
+_mine_controllers = {}
+_mine_controllers_lock = threading.Lock()
+
+
+def mine_controller(organism):
+    """Returns the MineController of the organism's mine, shared by every lookup in the process"""
+    url = service_urls[organism]
+    with _mine_controllers_lock:
+        if url not in _mine_controllers:
+            _mine_controllers[url] = MineController(url)
+        return _mine_controllers[url]
+
+
+def mine_slot(organism):
+    """
+        Returns a context manager holding one of the requests the organism's mine accepts at a time, for a request
+        that is not to tune its controller (see MineController.slot)"""
+    return mine_controller(organism).slot()
+
+
+def mine_stats():
+    """The state of every mine's controller, by URL (see MineController.stats)"""
+    with _mine_controllers_lock:
+        controllers = list(_mine_controllers.values())
+    return {controller.url: controller.stats() for controller in controllers}
+
+
+class Cancelled(Exception):
+    """Raised by lookups that are still to run when the job they belong to was cancelled"""
+
+
+class Progress:
+    """
+        Progress of the lookups of a job (e.g. building a network from the GUI), and the means to cancel it
+        While a Progress is tracked (see track), every query is counted and every lookup checks it before querying
+        the mine, so that a cancelled job stops between chunks without leaving a query half-done"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.ids = 0
+        self.ids_done = 0
+        self.queries = 0
+        self.rows = 0
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise Cancelled()
+
+    def planned(self, ids):
+        with self._lock:
+            self.ids += ids
+
+    def chunk_done(self, ids):
+        with self._lock:
+            self.ids_done += ids
+
+    def received(self, rows):
+        with self._lock:
+            self.queries += 1
+            self.rows += rows
+
+    def fraction(self):
+        return self.ids_done / self.ids if self.ids else 0.0
+
+    def eta(self):
+        """Estimated seconds until the planned IDs are resolved, or None before the first chunk is"""
+        if not self.ids_done:
+            return None
+        elapsed = time.time() - self.started
+        return elapsed / self.ids_done * (self.ids - self.ids_done)
+
+
+_progress = None
+
+
+@contextmanager
+def track(progress):
+    """Reports the lookups made in the 'with' block (from any thread) to 'progress'"""
+    global _progress
+    _progress = progress
+    try:
+        yield progress
+    finally:
+        _progress = None
+
+
+def _query_rows(ids, organism, views, outer_joins=()):
+    """Yields the rows of a LOOKUP for 'ids' selecting 'views' as they are read from the response"""
+    progress = _progress
+    if progress is not None:
+        progress.check()
+
+    query = intermine_query(','.join(ids), organism, views, outer_joins=outer_joins)
+    rows = 0
+    with mine_controller(organism).request(len(ids), progress):
+        # the rows are parsed straight from the JSON response stream as plain lists, without wrapping each of them
+        # in a ResultRow object, and handed on one at a time instead of being collected first
+        with timer('query round-trip'):
+            for row in query.results(row='json'):
+                rows += 1
+                yield row
+    count('queries')
+    observe('rows per query', rows)
+    if progress is not None:
+        progress.received(rows)
+
+
+def _has_path(organism, path):
+    """Whether the data model of the organism's mine has 'path' (e.g. not every mine has cross-references)"""
+    try:
+        get_service(organism).model.make_path(path)
+    except ModelError:
+        return False
+    return True
+
+
+def _attribute_rows(ids, organism, views, outer_joins=(), values=None):
+    """
+        Runs a single LOOKUP for 'ids' and works out which submitted ID every result row belongs to.
+        Returns a dictionary mapping each ID to its rows. Every row is the tuple of 'views' values followed by the
+        primaryIdentifier of the gene it describes"""
+
+    query_views = list(views) + [field for field in KEY_FIELDS if field not in views]
+    key_positions = [query_views.index(field) for field in KEY_FIELDS]
+    record_positions = list(range(len(views))) + [query_views.index('primaryIdentifier')]
+    # the values of a response repeat a lot (the identifiers of a gene are on every one of its rows); every record
+    # refers to a single copy of each, shared with the other chunks of the lookup through 'values'
+    if values is None:
+        values = {}
+
+    def records(query_ids):
+        for row in _query_rows(query_ids, organism, query_views, outer_joins):
+            yield row, tuple(values.setdefault(row[position], row[position]) for position in record_positions)
+
+    wanted = set(ids)
+    by_id = {gene_id: [] for gene_id in ids}
+    rows_by_gene = {}
+    for row, record in records(ids):
+        rows_by_gene.setdefault(record[-1], []).append(record)
+        for gene_id in wanted.intersection(row[position] for position in key_positions):
+            by_id[gene_id].append(record)
+
+    unmatched = [gene_id for gene_id in ids if not by_id[gene_id]]
+    if not unmatched:
+        return by_id
+
+    # the other IDs were matched through a synonym (e.g. an outdated identifier) or a cross-reference (e.g. a UniProt
+    # accession), possibly of a gene another ID of the chunk matched directly. Looking up the unmatched IDs and the
+    # genes no ID claimed again, with their synonyms and then their cross-references, tells which genes they belong
+    # to; each is fetched with a single query for the whole chunk
+    attributed = {(gene_id, record[-1]) for gene_id, gene_records in by_id.items() for record in gene_records}
+
+    def attribute(aliases):
+        for primary_id, alias in aliases:
+            if alias in wanted and primary_id in rows_by_gene and (alias, primary_id) not in attributed:
+                by_id[alias].extend(rows_by_gene[primary_id])
+                attributed.add((alias, primary_id))
+
+    def unresolved():
+        claimed = {primary_id for gene_id, primary_id in attributed}
+        return ([gene_id for gene_id in unmatched if not by_id[gene_id]],
+                [primary_id for primary_id in rows_by_gene if primary_id not in claimed])
+
+    for path in ('synonyms.value', 'crossReferences.identifier'):
+        unmatched_ids, orphans = unresolved()
+        if not unmatched_ids and not orphans:
+            break
+        if path == 'synonyms.value' or _has_path(organism, 'Gene.' + path):
+            attribute(_query_rows(unique_ids(unmatched_ids + orphans), organism, ['primaryIdentifier', path]))
+
+    unmatched_ids, orphans = unresolved()
+    if unmatched_ids and orphans:
+        # the genes no ID claimed belong to some of the unmatched IDs, but there is no telling which: those IDs are
+        # looked up one at a time, so that no ID is given the rows of another
+        count('IDs looked up alone', len(unmatched_ids))
+        for gene_id in unmatched_ids:
+            by_id[gene_id] = [record for row, record in records([gene_id])]
+    return by_id
+
+
+def _attribute_chunk(ids, organism, views, outer_joins=(), values=None):
+    """
+        Runs _attribute_rows for a single chunk, retrying with exponential backoff if the mine is overloaded or
+        unreachable. Other errors (e.g. an invalid query) would fail again and are raised at once"""
+    delay = RETRY_DELAY
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return _attribute_rows(ids, organism, views, outer_joins, values)
+        except OSError as error:
+            # WebserviceError and URLError are both OSErrors
+            if attempt == MAX_RETRIES or not overloaded(error):
+                raise
+            # the jitter keeps the chunks that failed together from being retried together
+            time.sleep(delay / 2 + random.uniform(0, delay / 2))
+            delay *= 2
+
+
+def chunks(items, size):
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+class ChunkFeed:
+    """Hands out the IDs of a lookup to its worker threads, in chunks of the mine's current chunk size"""
+
+    def __init__(self, ids, controller):
+        self.ids = ids
+        self.controller = controller
+        self.position = 0
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            chunk = self.ids[self.position:self.position + self.controller.chunk_size]
+            self.position += len(chunk)
+            return chunk
+
+    def close(self):
+        """Hands out no more chunks"""
+        with self._lock:
+            self.position = len(self.ids)
+
+
+@timed('lookup_rows_by_id')
+def lookup_rows_by_id(ids, organism, views, outer_joins=()):
+    """
+        Resolves every distinct ID in 'ids' with a LOOKUP query selecting 'views' and returns a dictionary mapping each
+        ID to its result rows. Results are served from the cache when possible; only the missing IDs are sent to the
+        mine, split into chunks that are queried concurrently. 'outer_joins' lists the references of the query that are
+        outer-joined. Every row carries the primaryIdentifier of its gene as an extra last element"""
+
+    ids = unique_ids(ids)
+    url = service_urls[organism]
+
+    # rows are cached with their columns in a canonical order so that queries selecting the same paths in a
+    # different order share entries. The rows themselves are only put in that order while they are cached
+    views = list(views)
+    canonical_views = sorted(set(views))
+    to_views = [canonical_views.index(view) for view in views] + [-1]
+    to_canonical = [views.index(view) for view in canonical_views] + [-1]
+
+    keys = {gene_id: cache.make_key(organism, url, canonical_views, gene_id, outer_joins) for gene_id in ids}
+    cached = cache.get_many(keys.values())
+
+    resolved = {}
+    missing = []
+    values = {}
+    for gene_id in ids:
+        if keys[gene_id] in cached:
+            resolved[gene_id] = [tuple(values.setdefault(row[position], row[position]) for position in to_views)
+                                 for row in cached.pop(keys[gene_id])]
+        else:
+            missing.append(gene_id)
+    count('IDs served from cache', len(ids) - len(missing))
+    count('IDs requested', len(missing))
+
+    progress = _progress
+
+    def fetch(chunk):
+        fetched = _attribute_chunk(chunk, organism, views, outer_joins, values)
+        # every chunk is cached as soon as it arrives, so a failure elsewhere (or cancelling) does not lose it
+        cache.put_many({keys[gene_id]: [[row[position] for position in to_canonical] for row in rows]
+                        for gene_id, rows in fetched.items()})
+        if progress is not None:
+            progress.chunk_done(len(chunk))
+        return fetched
+
+    if missing:
+        if progress is not None:
+            progress.planned(len(missing))
+
+        # the chunks are cut as the workers get to them, so a chunk size the mine's controller changed applies to the
+        # rest of this lookup already
+        controller = mine_controller(organism)
+        feed = ChunkFeed(missing, controller)
+
+        def work():
+            fetched = {}
+            try:
+                for chunk in iter(feed.next, []):
+                    fetched.update(fetch(chunk))
+            except BaseException:
+                # the other workers stop after their current chunk
+                feed.close()
+                raise
+            return fetched
+
+        workers = max(1, min(MINE_CONCURRENCY, len(chunks(missing, controller.chunk_size))))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(work) for _ in range(workers)]:
+                resolved.update(future.result())
+
+    return {gene_id: resolved[gene_id] for gene_id in ids}
+
+
+def iter_merged_rows(resolved, ids=None):
+    """
+        Yields the per-ID rows returned by lookup_rows_by_id as a single stream of rows, in order of the submitted
+        IDs. Genes matched by more than one ID are only included once, as they would be by a single LOOKUP query"""
+
+    seen = set()
+    for gene_id in (unique_ids(ids) if ids is not None else resolved):
+        genes = set()
+        for row in resolved.get(gene_id, ()):
+            if row[-1] not in seen:
+                genes.add(row[-1])
+                yield row[:-1]
+        seen |= genes
+
+
+def merge_rows(resolved, ids=None):
+    """Returns the rows of iter_merged_rows as a list"""
+    return list(iter_merged_rows(resolved, ids))
+
+
+def lookup_rows(ids, organism, views):
+    """Returns the rows a LOOKUP query for 'ids' selecting 'views' would return"""
+    return merge_rows(lookup_rows_by_id(ids, organism, views))
+
+
+class ColumnarBuffer:
+    """
+        Collects a stream of rows into per-column buffers, one page of rows at a time
+        Categorical columns are stored as integer codes into a table of their distinct values, so identifiers,
+        symbols and interaction types that repeat across rows are only kept once"""
+
+    def __init__(self, columns, categorical=()):
+        self.columns = list(columns)
+        self.categories = {column: {} for column in self.columns if column in categorical}
+        self.buffers = {column: array('i') if column in self.categories else [] for column in self.columns}
+
+    def extend(self, rows):
+        rows = iter(rows)
+        page = list(islice(rows, PAGE_SIZE))
+        while page:
+            for position, column in enumerate(self.columns):
+                if column in self.categories:
+                    categories = self.categories[column]
+                    self.buffers[column].extend(-1 if row[position] is None else
+                                                categories.setdefault(row[position], len(categories))
+                                                for row in page)
+                else:
+                    self.buffers[column].extend(row[position] for row in page)
+            page = list(islice(rows, PAGE_SIZE))
+        return self
+
+    def to_frame(self):
+        data = {}
+        for column in self.columns:
+            if column in self.categories:
+                data[column] = pd.Categorical.from_codes(np.frombuffer(self.buffers[column], dtype=np.intc),
+                                                         categories=object_index(self.categories[column]))
+            else:
+                data[column] = self.buffers[column]
+        return pd.DataFrame(data, columns=self.columns)
+
+
+@timed('rows_to_frame')
+def rows_to_frame(rows, columns, categorical=()):
+    """Builds a DataFrame from a stream of rows; the 'categorical' columns get the category dtype"""
+    return ColumnarBuffer(columns, categorical).extend(rows).to_frame()
+
+
+def lookup_frame(ids, organism, views, columns=None, categorical=()):
+    """Returns the rows of lookup_rows as a DataFrame, naming the views 'columns'"""
+    return rows_to_frame(iter_merged_rows(lookup_rows_by_id(ids, organism, views)), columns or views, categorical)
+
+
+def lookup_frames(id_lists, organism, views, columns=None, categorical=()):
+    """
+        Returns one lookup_frame per list of IDs in 'id_lists', resolving the union of all the IDs with a single
+        lookup. Each frame holds the same rows a separate lookup of its own IDs would return"""
+    id_lists = [unique_ids(ids) for ids in id_lists]
+    resolved = lookup_rows_by_id((gene_id for ids in id_lists for gene_id in ids), organism, views)
+    return [rows_to_frame(iter_merged_rows(resolved, ids), columns or views, categorical) for ids in id_lists]
+
+
+def object_index(values):
+    """
+        Categories are always kept with the object dtype, so that categoricals built from different rows (or from no
+        rows at all) can be combined with union_categoricals"""
+    return pd.Index(list(values), dtype=object)
+
+
+def as_categorical(values):
+    """Returns the values of a Series or array as a Categorical, without copying them if they already are one"""
+    if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        return values.array if isinstance(values, pd.Series) else values
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    return pd.Categorical.from_codes(codes, categories=object_index(uniques))
+
+
+def concat_frames(frames):
+    """
+        Concatenates frames with the same columns, like pd.concat(frames, ignore_index=True). Columns that are
+        categorical in every frame stay categorical instead of being expanded to objects"""
+    if not frames:
+        raise ValueError('No objects to concatenate')
+
+    data = {}
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            data[column] = union_categoricals(parts, ignore_order=True)
+        else:
+            data[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(data, columns=frames[0].columns)
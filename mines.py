@@ -0,0 +1,12 @@
+"""
+    The InterMine webservices NetR and AttR query, by organism
+    Kept apart from intermine_utils, so that the windows can list the organisms without importing the InterMine client"""
+
+service_urls = {
+    'Drosophila melanogaster': "https://www.flymine.org/query/service",
+    'Danio rerio': "https://zmine.zfin.org/service",
+    'Caenorhabditis elegans': "https://intermine.wormbase.org/tools/wormmine/service",
+    'Rattus norvegicus': "https://ratmine.org/ratmine/service",
+    'Mus musculus': "https://www.mousemine.org/mousemine/service",
+    'Homo sapiens': "https://www.humanmine.org/humanmine/service",
+}
@@ -0,0 +1,582 @@
+"""
+    The NetR pipeline without the graphical interface
+    Network and Wheel turn the submitted datasets into an edge table; they do not depend on tkinter, so the pipeline
+    can be run headless (see NetR_batch.py)"""
+
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import count, timed
+from intermine.model import ModelError
+from intermine_utils import (intermine_query, lookup_rows_by_id, iter_merged_rows, unique_ids, rows_to_frame,
+                             as_categorical, object_index, concat_frames, CACHE_DIR, MAX_WORKERS)
+from pandas.api.types import union_categoricals
+import gzip
+import hashlib
+import json
+import numpy as np
+import os
+import pandas as pd
+import time
+
+
+class Network:
+    """
+        Iterable container for wheels
+        Organism will be set when the first element is added
+        Download will be set when the first element is added (this way if the database does not have interaction
+        data, we can turn off the integration and continue with the standalone mode)"""
+
+    def __init__(self, download=False):
+        self.download = download
+        self.container = []
+        self.index = -1
+
+    def append(self, wheel):
+        self.container.append(wheel)
+        if len(self.container) == 1:
+            self.organism = wheel.organism
+
+    def __iter__(self):
+        """Makes Network an Iterator"""
+        self.index = -1
+        return self
+
+    def __next__(self):
+        """Iterates over the container"""
+        self.index += 1
+        if self.index >= len(self.container):
+            raise StopIteration
+        return self.container[self.index]
+
+    def __getitem__(self, item):
+        return self.container[item]
+
+    def __setitem__(self, key, value):
+        self.container[key] = value
+
+
+CORE_VIEWS = ['primaryIdentifier', 'secondaryIdentifier', 'symbol']
+
+PRIMARY_VIEWS = ['symbol', 'secondaryIdentifier', 'primaryIdentifier']
+
+SECONDARY_VIEWS = ['primaryIdentifier', 'secondaryIdentifier',
+                   'symbol', 'interactions.details.type',
+                   'interactions.participant2.symbol',
+                   'interactions.participant2.'
+                   'secondaryIdentifier',
+                   'interactions.participant2.'
+                   'primaryIdentifier']
+
+
+EDGE_COLUMNS = ["Source Primary Identifier",
+                "Source Secondary Identifier",
+                "Source Symbol",
+                "Interaction",
+                "Target Symbol",
+                "Target Secondary Identifier",
+                "Target Primary Identifier"]
+
+
+class Wheel:
+    """
+        One user-submitted dataset: a core gene and the IDs found to interact with it
+        The update methods accept the per-ID rows of a network-wide resolution (see resolve_network); without them,
+        each method queries InterMine for the wheel's own IDs"""
+
+    def __init__(self, info):
+        self.organism = info['organism']
+        # core is replaced by its resolved frame in update_core; core_id keeps the submitted identifier
+        self.core = info['core']
+        self.core_id = info['core']
+        self.technique = info['technique']
+        self.ids = list(info['ids'])
+        self.ids.append(self.core)
+        self.download = info['download']
+        self.name = info.get('dataset_name', '')
+
+        # what the wheel is built from; see fingerprint
+        self.source = {'core': info['core'], 'technique': self.technique, 'organism': self.organism,
+                       'download': bool(self.download)}
+        if info.get('file'):
+            self.source.update({'file': info['file'], 'columns': list(info.get('columns', ())),
+                                'header': bool(info.get('header', False))})
+
+    def fingerprint(self):
+        """
+            Hash of the wheel's inputs: the contents of its file and the selected columns (or the IDs themselves
+            when it was not read from a file), the core, technique, organism and download flag"""
+        source = dict(self.source)
+        if 'file' in source:
+            source['file'] = file_digest(source['file'])
+        else:
+            source['ids'] = hashlib.sha256('\n'.join(map(str, self.ids)).encode('utf8')).hexdigest()
+        return hashlib.sha256(json.dumps(source, sort_keys=True, default=str).encode('utf8')).hexdigest()
+
+    @timed('Wheel.update_core')
+    def update_core(self, resolved=None):
+        # make an intermine query with the core genes information
+        if resolved is None:
+            resolved = lookup_rows_by_id([self.core_id], self.organism, PRIMARY_VIEWS)
+
+        self.core = rows_to_frame(iter_merged_rows(resolved, [self.core_id]), PRIMARY_VIEWS,
+                                  categorical=PRIMARY_VIEWS)[CORE_VIEWS]
+
+    @timed('Wheel.update_primaries')
+    def update_primaries(self, resolved=None):
+        if resolved is None:
+            resolved = lookup_rows_by_id(self.ids, self.organism, PRIMARY_VIEWS)
+
+        self.primary_interactors_df = rows_to_frame(iter_merged_rows(resolved, self.ids), PRIMARY_VIEWS,
+                                                    categorical=PRIMARY_VIEWS)
+
+        self.primary_interactors_df['interactions.details.type'] = pd.Categorical.from_codes(
+            np.zeros(self.primary_interactors_df.shape[0], dtype=np.intc), categories=object_index([self.technique]))
+
+        new_cols = list(self.primary_interactors_df.columns)
+        new_cols = new_cols[-1:] + new_cols[:-1]
+
+        self.primary_interactors_df = self.primary_interactors_df[new_cols]
+
+    @timed('Wheel.get_secondaries')
+    def get_secondaries(self, resolved=None, expansion=None):
+        if resolved is None:
+            resolved = lookup_rows_by_id(self.ids, self.organism, SECONDARY_VIEWS)
+
+        rows = iter_merged_rows(resolved, self.ids)
+        if expansion is not None:
+            # the genes the wheel's IDs resolved to were expanded by its own query, whether any of their interactions
+            # are kept or not
+            expanded = ()
+            if hasattr(self, 'primary_interactors_df'):
+                expanded = self.primary_interactors_df['primaryIdentifier'].dropna()
+            rows = expansion.expand(rows, self.organism, expanded)
+
+        self.secondary_interactors_df = rows_to_frame(rows, EDGE_COLUMNS, categorical=EDGE_COLUMNS)
+
+    def release(self):
+        """Drops the frames of the wheel once its edges were written; the core is back to the submitted identifier"""
+        for name in WheelStore.FRAMES:
+            self.__dict__.pop(name, None)
+        self.core = self.core_id
+
+    @timed('Wheel.convert_to_dataframe')
+    def convert_to_dataframe(self):
+        # each core gene is paired with every primary interactor and the secondary interactions are appended below.
+        # The columns are categorical, so the core is broadcast by repeating its codes and the edge table is built
+        # once from the finished columns, however many primaries there are
+        core = [as_categorical(self.core[column]) for column in self.core.columns]
+        if self.core.shape[0] == 0:
+            # a core gene that could not be resolved leaves the source columns of its edges empty
+            core = [pd.Categorical.from_codes([-1], categories=object_index([])) for column in self.core.columns]
+        primaries = [as_categorical(self.primary_interactors_df[column]) for column in self.primary_interactors_df]
+
+        columns = [pd.Categorical.from_codes(np.repeat(column.codes, len(primaries[0])), dtype=column.dtype)
+                   for column in core]
+        columns += [pd.Categorical.from_codes(np.tile(column.codes, len(core[0])), dtype=column.dtype)
+                    for column in primaries]
+
+        if hasattr(self, 'secondary_interactors_df'):
+            columns = [union_categoricals([column, as_categorical(self.secondary_interactors_df.iloc[:, position])],
+                                          ignore_order=True)
+                       for position, column in enumerate(columns)]
+
+        self.dataframe = pd.DataFrame(dict(zip(EDGE_COLUMNS, columns)), columns=EDGE_COLUMNS)
+
+
+EDGE_KEY = ["Source Primary Identifier", "Target Primary Identifier", "Interaction"]
+
+INDEX_COLUMNS = EDGE_COLUMNS + ["Evidence", "Datasets"]
+
+
+class EdgeIndex:
+    """
+        Collapses the edges of a network as the wheels' edge tables are added to it
+        Edges are keyed on (source primary identifier, target primary identifier, interaction type); each distinct
+        edge keeps the first row it was seen with, the number of rows it was seen in (its evidence) and the datasets
+        that contributed it. When 'directed' is False, A-B and B-A of the same interaction type are the same edge"""
+
+    def __init__(self, directed=True):
+        self.directed = directed
+        self.edges = {}
+
+    def key(self, row):
+        source, target, interaction = (None if row[position] != row[position] else row[position]
+                                       for position in (0, 6, 3))
+        if not self.directed and (target or '') < (source or ''):
+            source, target = target, source
+        return source, target, interaction
+
+    @timed('EdgeIndex.add')
+    def add(self, dataframe, dataset=''):
+        for row in dataframe[EDGE_COLUMNS].itertuples(index=False, name=None):
+            key = self.key(row)
+            edge = self.edges.get(key)
+            if edge is None:
+                self.edges[key] = [row, 1, [dataset]]
+            else:
+                edge[1] += 1
+                if dataset not in edge[2]:
+                    edge[2].append(dataset)
+        return self
+
+    def __len__(self):
+        return len(self.edges)
+
+    @timed('EdgeIndex.to_frame')
+    def to_frame(self, separator=';'):
+        rows = (tuple(None if value != value else value for value in row) + (evidence, separator.join(datasets))
+                for row, evidence, datasets in self.edges.values())
+        return rows_to_frame(rows, INDEX_COLUMNS, categorical=EDGE_COLUMNS)
+
+
+class Expansion:
+    """
+        Expands the interactions of a wheel beyond the first hop
+        Every hop queries the interactions of the genes first reached by the previous hop (its frontier); genes that
+        were already expanded are never queried again. The frontier of a hop is capped at 'max_hop_nodes' genes and
+        its new edges at 'max_hop_edges'; the expansion stops once 'max_nodes' genes were expanded or 'max_edges'
+        edges were collected. With 'interaction_types', only interactions of those types are followed and kept"""
+
+    def __init__(self, hops=1, max_hop_nodes=None, max_hop_edges=None, max_nodes=None, max_edges=None,
+                 interaction_types=None):
+        self.hops = hops
+        self.max_hop_nodes = max_hop_nodes
+        self.max_hop_edges = max_hop_edges
+        self.max_nodes = max_nodes
+        self.max_edges = max_edges
+        self.interaction_types = set(interaction_types) if interaction_types else None
+
+    def settings(self):
+        return {'hops': self.hops, 'max_hop_nodes': self.max_hop_nodes, 'max_hop_edges': self.max_hop_edges,
+                'max_nodes': self.max_nodes, 'max_edges': self.max_edges,
+                'interaction_types': sorted(self.interaction_types) if self.interaction_types else None}
+
+    def keep(self, rows, edges):
+        """Applies the interaction type filter and the edge caps to the rows of one hop"""
+        rows = [row for row in rows if self.interaction_types is None or row[3] in self.interaction_types]
+        limits = [limit for limit in (self.max_hop_edges,
+                                      None if self.max_edges is None else max(self.max_edges - edges, 0))
+                  if limit is not None]
+        return rows[:min(limits)] if limits else rows
+
+    def frontier(self, rows, visited):
+        """The genes reached by 'rows' that were not expanded yet, within the node caps"""
+        frontier = unique_ids(row[6] for row in rows if row[6] is not None and row[6] not in visited)
+        limits = [limit for limit in (self.max_hop_nodes,
+                                      None if self.max_nodes is None else max(self.max_nodes - len(visited), 0))
+                  if limit is not None]
+        return frontier[:min(limits)] if limits else frontier
+
+    def expand(self, rows, organism, expanded=()):
+        """
+            Returns the first-hop interaction rows of a wheel followed by the rows of the further hops. 'expanded'
+            are the primary identifiers of the genes the wheel's own query expanded"""
+        rows = list(rows)
+        # the genes of the first hop were expanded by the wheel's own query, including those whose interactions are
+        # all filtered out below
+        visited = set(expanded)
+        visited.update(row[0] for row in rows)
+        rows = self.keep(rows, 0)
+        edges = list(rows)
+
+        frontier = self.frontier(rows, visited)
+        for hop in range(1, self.hops):
+            if not frontier or (self.max_edges is not None and len(edges) >= self.max_edges):
+                break
+
+            resolved = lookup_rows_by_id(frontier, organism, SECONDARY_VIEWS)
+            rows = self.keep(list(iter_merged_rows(resolved, frontier)), len(edges))
+            count('hop edges', len(rows))
+            edges.extend(rows)
+
+            visited.update(frontier)
+            frontier = self.frontier(rows, visited)
+
+        return edges
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as dataset_file:
+        for block in iter(lambda: dataset_file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class WheelStore:
+    """
+        Keeps the resolved frames of every wheel that was built, keyed by the wheel's fingerprint, so that rebuilding a
+        network only recomputes the wheels whose inputs changed. Only the frames the wheel's edge table is built from
+        are stored; the edge table itself is rebuilt from them when the wheel is loaded. Stored wheels expire after
+        'max_age' seconds, like the InterMine cache, since the mine's data can change as well. The frames are stored as
+        gzip-compressed JSON, with categorical columns as their categories and codes, so reading a store that someone
+        else could write to does not run any code"""
+
+    SOURCE_FRAMES = ('core', 'primary_interactors_df', 'secondary_interactors_df')
+    FRAMES = SOURCE_FRAMES + ('dataframe',)
+
+    def __init__(self, folder, max_age=7 * 24 * 3600):
+        self.folder = folder
+        self.max_age = max_age
+
+    def path(self, wheel, options=None):
+        key = wheel.fingerprint()
+        if options:
+            # settings that change how the wheel is built (see Expansion) are part of its key
+            key = hashlib.sha256((key + json.dumps(options, sort_keys=True)).encode('utf8')).hexdigest()
+        return os.path.join(self.folder, key + '.json.gz')
+
+    def stored(self, wheel, options=None):
+        """Returns whether the wheel is stored and has not expired, without loading it"""
+        try:
+            return time.time() - os.path.getmtime(self.path(wheel, options)) < self.max_age
+        except OSError:
+            return False
+
+    @staticmethod
+    def encode(frame):
+        columns = []
+        for name in frame.columns:
+            values = frame[name]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                columns.append({'name': name, 'categories': values.cat.categories.tolist(),
+                                'categories_dtype': str(values.cat.categories.dtype),
+                                'codes': values.cat.codes.tolist()})
+            else:
+                columns.append({'name': name, 'dtype': str(values.dtype),
+                                'values': [None if value != value else value for value in values.tolist()]})
+        return columns
+
+    @staticmethod
+    def decode(columns):
+        data = {}
+        for column in columns:
+            if 'codes' in column:
+                categories = pd.Index(column['categories'], dtype=column['categories_dtype'])
+                data[column['name']] = pd.Categorical.from_codes(np.asarray(column['codes'], dtype=np.intc),
+                                                                 categories=categories)
+            else:
+                data[column['name']] = pd.Series(column['values'], dtype=column['dtype'])
+        return pd.DataFrame(data, columns=[column['name'] for column in columns])
+
+    def load(self, wheel, options=None):
+        """Restores the wheel's frames if they are stored; returns whether they were"""
+        try:
+            path = self.path(wheel, options)
+            if time.time() - os.path.getmtime(path) >= self.max_age:
+                return False
+            with gzip.open(path, 'rt', encoding='utf8') as wheel_file:
+                frames = {name: self.decode(columns) for name, columns in json.load(wheel_file).items()
+                          if name in self.SOURCE_FRAMES}
+        except (OSError, EOFError, ValueError, KeyError, TypeError):
+            return False
+        if 'core' not in frames or 'primary_interactors_df' not in frames:
+            return False
+
+        for name, frame in frames.items():
+            setattr(wheel, name, frame)
+        wheel.convert_to_dataframe()
+        return True
+
+    def save(self, wheel, options=None):
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.path(wheel, options)
+        frames = {name: self.encode(getattr(wheel, name)) for name in self.SOURCE_FRAMES if hasattr(wheel, name)}
+        with gzip.open(path + '.tmp', 'wt', encoding='utf8') as wheel_file:
+            json.dump(frames, wheel_file)
+        os.replace(path + '.tmp', path)
+
+    def prune(self):
+        """Removes the stored wheels that have expired"""
+        try:
+            names = os.listdir(self.folder)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.folder, name)
+            try:
+                if time.time() - os.path.getmtime(path) >= self.max_age:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def wheel_store_from_environment():
+    """Returns the WheelStore configured by NETRATTR_WHEEL_DIR (default ~/.netrattr/wheels), or None if it is off"""
+    folder = os.environ.get('NETRATTR_WHEEL_DIR', os.path.join(CACHE_DIR, 'wheels'))
+    if folder.lower() in ('off', 'none', '0', ''):
+        return None
+    return WheelStore(folder, max_age=float(os.environ.get('NETRATTR_CACHE_TTL', 7 * 24 * 3600)))
+
+
+def node_symbols(master_dataframe):
+    """
+        Returns the symbol of every node of an edge table, as a Series indexed by the nodes' primary identifiers (in
+        order of first appearance, sources before targets). Nodes that were not resolved have no symbol"""
+    nodes = pd.concat([
+        pd.DataFrame({'Primary Identifier': np.asarray(master_dataframe[identifier], dtype=object),
+                      'Symbol': np.asarray(master_dataframe[symbol], dtype=object)})
+        for identifier, symbol in (("Source Primary Identifier", "Source Symbol"),
+                                   ("Target Primary Identifier", "Target Symbol"))], ignore_index=True)
+    nodes = nodes.dropna(subset=['Primary Identifier']).drop_duplicates(subset='Primary Identifier')
+    return nodes.set_index('Primary Identifier')['Symbol']
+
+
+def interactions_available(organism):
+    """Checks that the organism's InterMine has interaction data"""
+    try:
+        intermine_query('', organism, SECONDARY_VIEWS)
+    except ModelError:
+        return False
+    return True
+
+
+def read_dataset_ids(path, columns, header=False):
+    """
+        Reads a dataset file and returns the IDs in the selected columns as a single Series.
+        Columns can be given by position, or by name when the file has a header. Only the selected columns are read,
+        as text, so the memory used does not depend on how many other columns the file has"""
+    if any(isinstance(column, str) for column in columns):
+        names = list(pd.read_csv(path, nrows=0).columns)
+        columns = [names.index(column) if isinstance(column, str) else column for column in columns]
+
+    positions = sorted(set(columns))
+    table = pd.read_csv(path, header=0 if header else None, usecols=positions, dtype=str)
+    # usecols keeps the columns in file order
+    selected = [table.iloc[:, positions.index(column)] for column in columns]
+    return pd.concat((column.astype(str).str.strip() for column in selected), ignore_index=True)
+
+
+# number of rows read from a dataset file to preview it
+PREVIEW_ROWS = 5
+
+
+def split_fused(resolved):
+    """
+        Splits the per-ID rows of a fused query (SECONDARY_VIEWS with interactions outer-joined) into the per-ID rows
+        of the identifier view and of the interaction view"""
+    primaries = {}
+    secondaries = {}
+    for gene_id, rows in resolved.items():
+        genes = {}
+        for row in rows:
+            # a gene has one row per interaction, or a single row of nulls if it has none
+            genes.setdefault(row[-1], [row[2], row[1], row[0], row[-1]])
+        primaries[gene_id] = list(genes.values())
+        secondaries[gene_id] = [row for row in rows if any(value is not None for value in row[3:-1])]
+    return primaries, secondaries
+
+
+@timed('resolve_network')
+def resolve_network(network, max_workers=MAX_WORKERS, fused=True, wheels=None):
+    """
+        Planning stage of make_network: collects the distinct IDs of all wheels and resolves each of them once per
+        view, instead of once per wheel. Returns the per-ID rows for the identifier view and, when interaction data
+        is downloaded, for the interaction view.
+        In fused mode both views come from a single query that outer-joins the interactions, which halves the number
+        of round-trips when interaction data is downloaded.
+        'wheels' restricts the resolution to some of the network's wheels"""
+    wheels = list(network) if wheels is None else wheels
+    identifiers = unique_ids(gene_id for wheel in wheels for gene_id in [wheel.core_id] + wheel.ids)
+    interactors = unique_ids(gene_id for wheel in wheels for gene_id in wheel.ids)
+
+    if network.download and fused:
+        resolved = lookup_rows_by_id(identifiers, network.organism, SECONDARY_VIEWS, outer_joins=['interactions'])
+        return split_fused(resolved)
+
+    # the two views are independent of each other, so they are resolved concurrently
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        primaries = executor.submit(lookup_rows_by_id, identifiers, network.organism, PRIMARY_VIEWS)
+        secondaries = None
+        if network.download:
+            secondaries = executor.submit(lookup_rows_by_id, interactors, network.organism, SECONDARY_VIEWS)
+
+        return primaries.result(), secondaries.result() if secondaries is not None else None
+
+
+@timed('make_network')
+def make_network(network, max_workers=MAX_WORKERS, fused=True, collapse=False, directed=True, store=None,
+                 expansion=None, writer=None):
+    """
+        Runs every wheel of the network and returns the combined edge table
+        IDs shared between wheels are resolved only once (see resolve_network) and the rows are handed out to each
+        wheel. The wheels are assembled in their submission order.
+        With 'collapse', duplicate edges are merged into one row with an evidence count and the contributing datasets
+        (see EdgeIndex).
+        With a WheelStore as 'store', wheels whose inputs did not change since they were last built are restored from
+        it instead of being resolved again, and the wheels that are built are saved to it.
+        With an Expansion, interaction data is expanded over more than one hop (see Expansion).
+        With a writer (see exporters), every wheel is resolved when its turn comes instead of in the planning pass, its
+        edges are appended to the writer as soon as it is done and its frames are dropped, so only one wheel is held
+        in memory at a time; IDs shared with earlier wheels then come from the lookup cache. The number of edges
+        written is returned instead of the edge table"""
+    try:
+        options = expansion.settings() if expansion is not None and network.download else None
+
+        wheels = list(network)
+        stored = [False] * len(wheels)
+        if store is not None:
+            store.prune()
+            stored = [store.stored(wheel, options) for wheel in wheels]
+
+        # the rows of an ID are dropped once the last wheel that needs them was built
+        pending = [wheel for wheel, is_stored in zip(wheels, stored) if not is_stored]
+        primaries = secondaries = None
+        released = {}
+        # with a writer, each wheel is resolved on its own when its turn comes, so the rows of the whole network are
+        # never held at once
+        planned = writer is None
+        if pending and planned:
+            primaries, secondaries = resolve_network(network, max_workers, fused, pending)
+            last_use = {}
+            for wheel in pending:
+                for gene_id in unique_ids([wheel.core_id] + wheel.ids):
+                    last_use[gene_id] = wheel
+            for gene_id, wheel in last_use.items():
+                released.setdefault(wheel, []).append(gene_id)
+
+        index = EdgeIndex(directed) if collapse else None
+        for wheel, is_stored in zip(wheels, stored):
+            # stored wheels are only loaded when their turn comes. One that expired in the meantime was not resolved
+            # with the others, so it is built with queries of its own
+            if not (is_stored and store.load(wheel, options)):
+                if is_stored:
+                    wheel_primaries, wheel_secondaries = None, None
+                elif planned:
+                    wheel_primaries, wheel_secondaries = primaries, secondaries
+                else:
+                    wheel_primaries, wheel_secondaries = resolve_network(network, max_workers, fused, [wheel])
+                wheel.update_core(wheel_primaries)
+                wheel.update_primaries(wheel_primaries)
+                if network.download:
+                    wheel.get_secondaries(wheel_secondaries, expansion)
+                wheel.convert_to_dataframe()
+                if store is not None:
+                    store.save(wheel, options)
+
+                for gene_id in released.pop(wheel, ()):
+                    for resolved in (primaries, secondaries):
+                        if resolved is not None:
+                            resolved.pop(gene_id, None)
+
+            if index is not None:
+                index.add(wheel.dataframe, wheel.name)
+            elif writer is not None:
+                writer.append(wheel.dataframe)
+            if writer is not None:
+                wheel.release()
+
+        if index is not None:
+            master_dataframe = index.to_frame()
+            if writer is None:
+                return master_dataframe
+            writer.append(master_dataframe)
+        if writer is not None:
+            return writer.rows
+
+        if not wheels:
+            return pd.DataFrame(columns=EDGE_COLUMNS)
+        return concat_frames([wheel.dataframe for wheel in network.container])
+    except ValueError as ve:
+        if str(ve) == 'No objects to concatenate':
+            return network[0].dataframe
+        raise ve
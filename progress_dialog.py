@@ -0,0 +1,108 @@
+"""
+    Runs the InterMine work of NetR and AttR off the Tk main thread
+    ProgressDialog shows the queries made, rows received and an estimate of the time left while the work runs, and
+    lets the user cancel it. Work that was cancelled stops before its next query"""
+
+from concurrent.futures import ThreadPoolExecutor
+from startup import LazyModule
+import tkinter as tk
+import tkinter.ttk as ttk
+import tkinter.messagebox as messagebox
+
+POLL_MS = 100
+
+intermine_utils = LazyModule('intermine_utils')
+
+# the GUIs run one job at a time; a single worker keeps them in submission order
+_executor = ThreadPoolExecutor(max_workers=1)
+
+
+class ProgressDialog(tk.Toplevel):
+    """
+        Runs 'work' in the background while the dialog is shown. When it has finished, 'done' is called on the Tk
+        thread with its result, or 'cancelled' (if given) when the user cancelled it. Errors are shown in a message
+        box. 'work' must not touch any Tk widget or variable"""
+
+    def __init__(self, parent, work, done, title="Working...", cancelled=None):
+        tk.Toplevel.__init__(self, parent)
+        self.title(title)
+        self.transient(parent)
+        self.resizable(False, False)
+
+        self.done = done
+        self.cancelled = cancelled
+        self.progress = intermine_utils.Progress()
+
+        frame = ttk.Frame(self, padding=10)
+        frame.grid(row=0, column=0, sticky='nsew')
+
+        self.bar = ttk.Progressbar(frame, mode='indeterminate', length=320, maximum=100)
+        self.bar.grid(row=0, column=0, columnspan=2, sticky='ew')
+        self.bar.start()
+
+        self.status = ttk.Label(frame, text="Starting...")
+        self.status.grid(row=1, column=0, sticky='w', pady=(5, 0))
+
+        self.cancel_button = ttk.Button(frame, text="Cancel", command=self.cancel)
+        self.cancel_button.grid(row=1, column=1, sticky='e', pady=(5, 0))
+
+        self.protocol('WM_DELETE_WINDOW', self.cancel)
+        try:
+            self.grab_set()
+        except tk.TclError:
+            # some window managers refuse a grab before the window is mapped; the dialog still works without it
+            pass
+
+        self.future = _executor.submit(self.run, work)
+        self.after(POLL_MS, self.poll)
+
+    def run(self, work):
+        with intermine_utils.track(self.progress):
+            return work()
+
+    def cancel(self):
+        self.progress.cancel()
+        self.cancel_button.state(['disabled'])
+        self.status.config(text="Cancelling after the queries in progress...")
+
+    def update_status(self):
+        progress = self.progress
+        if progress.cancelled:
+            return
+
+        if progress.ids:
+            if str(self.bar['mode']) != 'determinate':
+                self.bar.stop()
+                self.bar.config(mode='determinate')
+            self.bar['value'] = 100 * progress.fraction()
+
+        status = "{} queries, {} rows received".format(progress.queries, progress.rows)
+        eta = progress.eta()
+        if eta is not None:
+            status += ", about {:.0f} s left".format(eta)
+        self.status.config(text=status)
+
+    def poll(self):
+        if not self.future.done():
+            self.update_status()
+            self.after(POLL_MS, self.poll)
+            return
+
+        self.bar.stop()
+        self.grab_release()
+        self.destroy()
+
+        try:
+            result = self.future.result()
+        except intermine_utils.Cancelled:
+            result = None
+        except Exception as error:
+            messagebox.showerror(title=repr(error), message="The task could not be completed\n{}".format(repr(error)))
+            return
+
+        if self.progress.cancelled:
+            if self.cancelled is not None:
+                self.cancelled()
+            return
+
+        self.done(result)
@@ -0,0 +1,254 @@
+"""
+    On-disk index from gene identifiers and synonyms to current gene symbols
+    The index of an organism is downloaded from its mine once, in bulk, and stored as flat files that are memory-mapped
+    when loaded: the keys and symbols as UTF-8 blobs with offset arrays, and an open-addressing hash table of key
+    positions. Looking up an identifier costs a hash and a few probes, without any query to the mine.
+
+    Usage:
+        python synonym_index.py "Drosophila melanogaster" ["Homo sapiens" ...]
+        python synonym_index.py --all
+
+    Indexes are stored in ~/.netrattr/synonyms (NETRATTR_SYNONYM_DIR, or 'off' to never use them) and are rebuilt by
+    downloading them again. Like cached lookups, an index expires after NETRATTR_CACHE_TTL seconds; an expired index is
+    not used until it is downloaded again"""
+
+from instrumentation import count, timed
+from intermine_utils import CACHE_DIR, service_urls, get_service, mine_slot
+import argparse
+import hashlib
+import json
+import mmap
+import numpy as np
+import os
+import shutil
+import sys
+import time
+import zlib
+
+EMPTY = -1
+
+
+def index_folder(organism):
+    """Returns the folder of the organism's index, or None when indexes are switched off"""
+    root = os.environ.get('NETRATTR_SYNONYM_DIR', os.path.join(CACHE_DIR, 'synonyms'))
+    if root.lower() in ('off', 'none', '0', ''):
+        return None
+    return os.path.join(root, hashlib.sha256(service_urls[organism].encode('utf8')).hexdigest()[:16])
+
+
+def key_hash(key):
+    # crc32 is stable across processes (unlike hash()) and runs in C
+    return zlib.crc32(key)
+
+
+def _map_blob(path):
+    with open(path, 'rb') as blob_file:
+        if os.fstat(blob_file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _write_blob(folder, name, strings):
+    encoded = [string.encode('utf8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    with open(os.path.join(folder, name + '.bin'), 'wb') as blob_file:
+        blob_file.write(b''.join(encoded))
+    np.save(os.path.join(folder, name + '_offsets.npy'), offsets)
+
+
+class SynonymIndex:
+    """
+        Read-only mapping of identifiers (symbols, primary and secondary identifiers and synonyms) to the current
+        symbol of their gene. Current identifiers take precedence over synonyms that happen to be equal to them"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, 'meta.json')) as meta_file:
+            self.meta = json.load(meta_file)
+        self.keys = _map_blob(os.path.join(folder, 'keys.bin'))
+        self.key_offsets = np.load(os.path.join(folder, 'keys_offsets.npy'), mmap_mode='r')
+        self.symbols = _map_blob(os.path.join(folder, 'symbols.bin'))
+        self.symbol_offsets = np.load(os.path.join(folder, 'symbols_offsets.npy'), mmap_mode='r')
+        self.targets = np.load(os.path.join(folder, 'targets.npy'), mmap_mode='r')
+        self.slots = np.load(os.path.join(folder, 'slots.npy'), mmap_mode='r')
+        self.mask = len(self.slots) - 1
+
+    def __len__(self):
+        return len(self.targets)
+
+    def age(self):
+        """Seconds since the index was built"""
+        return time.time() - self.meta.get('created', 0)
+
+    def _find(self, key):
+        key = key.encode('utf8')
+        slot = key_hash(key) & self.mask
+        while True:
+            position = int(self.slots[slot])
+            if position == EMPTY:
+                return EMPTY
+            if self.keys[int(self.key_offsets[position]):int(self.key_offsets[position + 1])] == key:
+                return position
+            slot = (slot + 1) & self.mask
+
+    def _symbol(self, position):
+        target = int(self.targets[position])
+        return self.symbols[int(self.symbol_offsets[target]):int(self.symbol_offsets[target + 1])].decode('utf8')
+
+    def get(self, key, default=None):
+        position = self._find(str(key).strip())
+        return default if position == EMPTY else self._symbol(position)
+
+    def __contains__(self, key):
+        return self._find(str(key).strip()) != EMPTY
+
+    def map(self, keys):
+        """Returns the symbol of every key (None for unknown keys); each distinct key is only looked up once"""
+        found = {}
+        symbols = []
+        for key in keys:
+            if key not in found:
+                found[key] = None if key is None or key != key else self.get(key)
+            symbols.append(found[key])
+        count('synonym index lookups', len(found))
+        return symbols
+
+    @classmethod
+    def build(cls, folder, genes, meta=None):
+        """
+            Writes an index for 'genes', an iterable of (symbol, identifiers, synonyms) tuples, to 'folder' and
+            returns it loaded"""
+        targets = {}
+        symbols = {}
+        synonyms = []
+        for symbol, identifiers, gene_synonyms in genes:
+            if not symbol:
+                continue
+            target = symbols.setdefault(symbol, len(symbols))
+            for key in identifiers:
+                if key:
+                    targets.setdefault(key, target)
+            synonyms.append((target, gene_synonyms))
+        # synonyms are only added after every current identifier, so they can never shadow one
+        for target, gene_synonyms in synonyms:
+            for key in gene_synonyms:
+                if key:
+                    targets.setdefault(key, target)
+
+        keys = list(targets)
+        slots = np.full(max(2, 1 << (2 * len(keys)).bit_length()), EMPTY, dtype=np.int32)
+        mask = len(slots) - 1
+        for position, key in enumerate(keys):
+            slot = key_hash(key.encode('utf8')) & mask
+            while slots[slot] != EMPTY:
+                slot = (slot + 1) & mask
+            slots[slot] = position
+
+        os.makedirs(folder, exist_ok=True)
+        _write_blob(folder, 'keys', keys)
+        _write_blob(folder, 'symbols', list(symbols))
+        np.save(os.path.join(folder, 'targets.npy'), np.fromiter(targets.values(), dtype=np.int32, count=len(keys)))
+        np.save(os.path.join(folder, 'slots.npy'), slots)
+        with open(os.path.join(folder, 'meta.json'), 'w') as meta_file:
+            json.dump(dict(meta or {}, keys=len(keys), symbols=len(symbols), created=time.time()), meta_file)
+
+        return cls(folder)
+
+
+def iter_organism_genes(organism):
+    """Yields (symbol, identifiers, synonyms) for every gene of the organism, from one bulk query"""
+    service = get_service(organism)
+    query = service.new_query("Gene")
+    query.add_constraint("organism.name", "=", organism)
+    query.select('symbol', 'primaryIdentifier', 'secondaryIdentifier', 'synonyms.value')
+    query.outerjoin('synonyms')
+    query.add_sort_order('Gene.primaryIdentifier')
+
+    gene = None
+    # the download takes one of the mine's request slots, but far longer than any lookup, so it is kept out of the
+    # tuning of the mine's concurrency and chunk size
+    with mine_slot(organism):
+        # the rows of a gene are consecutive, one per synonym
+        for symbol, primary, secondary, synonym in query.results(row='json'):
+            if gene is None or gene[1][1] != primary:
+                if gene is not None:
+                    yield gene
+                gene = (symbol, (symbol, primary, secondary), [])
+            gene[2].append(synonym)
+    if gene is not None:
+        yield gene
+
+
+@timed('download synonym index')
+def download_index(organism):
+    """Downloads the organism's genes and synonyms from its mine and stores them as the organism's index"""
+    folder = index_folder(organism)
+    if folder is None:
+        raise ValueError("Synonym indexes are switched off (NETRATTR_SYNONYM_DIR)")
+
+    # the new index is written next to the old one and swapped in, so an index that is memory-mapped by a running
+    # process is never overwritten in place
+    for stale in (folder + '.tmp', folder + '.old'):
+        shutil.rmtree(stale, ignore_errors=True)
+    SynonymIndex.build(folder + '.tmp', iter_organism_genes(organism),
+                       {'organism': organism, 'url': service_urls[organism]})
+    if os.path.exists(folder):
+        os.rename(folder, folder + '.old')
+    os.rename(folder + '.tmp', folder)
+    shutil.rmtree(folder + '.old', ignore_errors=True)
+
+    _indexes.pop(folder, None)
+    _expired.discard(folder)
+    return load_index(organism)
+
+
+_indexes = {}
+_expired = set()
+
+
+def index_ttl():
+    return float(os.environ.get('NETRATTR_CACHE_TTL', 7 * 24 * 3600))
+
+
+def load_index(organism):
+    """
+        Returns the organism's index if it has been downloaded and has not expired, and None otherwise. Without an
+        index, identifiers are resolved with queries to the mine, so renamed or retired identifiers are never
+        resolved from an expired index"""
+    folder = index_folder(organism)
+    if folder is None or not os.path.exists(os.path.join(folder, 'meta.json')):
+        return None
+    if folder not in _indexes:
+        _indexes[folder] = SynonymIndex(folder)
+
+    index = _indexes[folder]
+    if index.age() > index_ttl():
+        if folder not in _expired:
+            _expired.add(folder)
+            print("The synonym index of {} was built {:.0f} days ago and has expired; identifiers are looked up on the "
+                  "mine instead. Run: python synonym_index.py \"{}\" to refresh it".format(
+                      organism, index.age() / 86400, organism), file=sys.stderr)
+        return None
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download the synonym index of one or more organisms")
+    parser.add_argument('organisms', nargs='*', help="organisms to download the index of")
+    parser.add_argument('--all', action='store_true', help="download the index of every supported organism")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    for organism in sorted(service_urls) if args.all else args.organisms:
+        try:
+            index = download_index(organism)
+            print("{}: {} identifiers of {} genes".format(organism, len(index), index.meta['symbols']))
+        except Exception as error:
+            failures += 1
+            print("{}: failed - {!r}".format(organism, error), file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
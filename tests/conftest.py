@@ -0,0 +1,37 @@
+"""
+    Shared fixtures: the tests run against benchmarks/fake_intermine.FakeMine, with the lookup cache, the saved models,
+    the wheel store and the synonym indexes kept out of the user's ~/.netrattr"""
+
+import os
+import sys
+
+# the cache is created when intermine_utils is imported, so these are set first
+os.environ['NETRATTR_CACHE'] = 'off'
+os.environ['NETRATTR_MODEL_DIR'] = 'off'
+os.environ['NETRATTR_WHEEL_DIR'] = 'off'
+os.environ['NETRATTR_SYNONYM_DIR'] = 'off'
+os.environ['NETRATTR_RETRY_DELAY'] = '0.01'
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from fake_intermine import FakeMine, ORGANISM
+import intermine_utils
+import pytest
+
+
+@pytest.fixture(scope='module')
+def mine():
+    """A mine of 300 genes with 3 interactions and 2 synonyms each, serving ORGANISM"""
+    with FakeMine(genes=300, interactions=3, synonyms=2) as fake_mine:
+        url = intermine_utils.service_urls[ORGANISM]
+        intermine_utils.service_urls[ORGANISM] = fake_mine.url
+        yield fake_mine
+        intermine_utils.service_urls[ORGANISM] = url
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    intermine_utils.cache.clear()
+    yield
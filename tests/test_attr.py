@@ -0,0 +1,134 @@
+from fake_intermine import ORGANISM
+import AttR
+import exporters
+import intermine_utils
+import netr_core
+import numpy as np
+import pandas as pd
+
+
+def attr(*tables):
+    model = AttR.AttR(gui=False)
+    model.info['Discrete and Continuous Attributes'] = list(tables)
+    return model
+
+
+def test_combine_attribute_tables_keeps_the_first_row_of_a_key_whole():
+    table = pd.DataFrame({'Mapping Key': ['a', 'b', 'a', None], 'score': [None, 2.0, 3.0, 4.0],
+                          'label': ['x', 'y', 'z', 'w']})
+    combined = attr(table).combine_attribute_tables()
+    assert combined.index.tolist() == ['a', 'b']
+    # the fields of 'a' come from the same source row, even though its score is missing there
+    assert combined.loc['a'].tolist()[1] == 'x'
+    assert np.isnan(combined.loc['a', 'score'])
+
+
+def test_combine_attribute_tables_aligns_on_the_key_and_renames_shared_columns():
+    first = pd.DataFrame({'Mapping Key': ['a', 'b'], 'score': [1.0, 2.0]})
+    second = pd.DataFrame({'Mapping Key': ['c', 'b', 'b'], 'score': [3.0, 4.0, 5.0], 'label': ['x', 'y', 'z']})
+    combined = attr(first, second).combine_attribute_tables()
+    assert list(combined.columns) == ['score', 'score.1', 'label']
+    assert combined.shape[0] == 3
+    assert combined.loc['b'].tolist() == [2.0, 4.0, 'y']
+
+
+def test_make_attribute_table_joins_the_nodes():
+    model = attr(pd.DataFrame({'Mapping Key': ['a', 'c', 'c'], 'score': [1.0, 2.0, 3.0]}))
+    model.nodes = pd.DataFrame({'Symbol': ['a', 'b', 'a', 'c']})
+    model.make_attribute_table(export=False)
+    table = model.attribute_table()
+    assert table['Mapping Key'].tolist() == ['a', 'b', 'c']
+    assert table['score'].tolist()[::2] == [1.0, 2.0]
+
+
+def test_membership_matrix():
+    nodes = ['g{}'.format(number) for number in range(11)]
+    matrix = AttR.MembershipMatrix(nodes)
+    matrix.add('odd', ['g1', 'g3', 'g9', 'g3', 'missing', None])
+    matrix.add('last', pd.Series(['g10']))
+    matrix.add('none', [])
+    assert len(matrix) == 3
+    assert matrix.bits().shape == (3, 2)
+
+    frame = matrix.to_frame(pd.Index(nodes))
+    assert list(frame.columns) == ['odd', 'last', 'none']
+    assert frame.index[frame['odd']].tolist() == ['g1', 'g3', 'g9']
+    assert frame.index[frame['last']].tolist() == ['g10']
+    assert not frame['none'].any()
+    assert matrix.to_long().values.tolist() == [['g1', 'odd'], ['g3', 'odd'], ['g9', 'odd'], ['g10', 'last']]
+
+
+def test_membership_matrix_matches_the_boolean_columns():
+    nodes = pd.Series(['g{}'.format(number) for number in range(100)])
+    lists = [nodes.sample(frac=0.3, random_state=seed).tolist() + ['other'] for seed in range(5)]
+    matrix = AttR.MembershipMatrix(nodes)
+    for number, members in enumerate(lists):
+        matrix.add('list {}'.format(number), members)
+    expected = pd.DataFrame({'list {}'.format(number): nodes.isin(members) for number, members in enumerate(lists)})
+    pd.testing.assert_frame_equal(matrix.to_frame(nodes.index), expected)
+
+
+def test_empty_membership_matrix():
+    matrix = AttR.MembershipMatrix(['g1', 'g2'])
+    assert matrix.to_frame().shape == (2, 0)
+    assert matrix.to_long().shape[0] == 0
+
+
+class Variable:
+    """Stands in for the Tk variables of the preview"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+def submit(model, table_type, path, names, mapping_key=0):
+    preview = AttR.AttributePreview.__new__(AttR.AttributePreview)
+    preview.table = pd.read_csv(path, nrows=5)
+    preview.path, preview.header, preview.table_type = path, True, table_type
+    preview.column_names = [Variable(name) for name in names]
+    preview.mapping_key_column = Variable(mapping_key)
+    preview.withdraw = lambda: None
+    preview.controller = type('Controller', (), {'controller': model, 'submit2': lambda self: None})()
+    preview.okay()
+
+
+def test_handed_over_network_gives_the_table_of_the_saved_network(mine, tmp_path, monkeypatch):
+    monkeypatch.setattr(AttR, 'ProgressDialog', lambda parent, work, done, **kwargs: done(work()))
+    built = netr_core.Network(True)
+    built.append(netr_core.Wheel({'dataset_name': 'test', 'organism': ORGANISM, 'core': 'gene1', 'technique': 'Y2H',
+                                  'ids': ['gene{}'.format(number) for number in range(20)] + ['bogus'],
+                                  'download': True}))
+    network = netr_core.make_network(built)
+    network_path = exporters.write_network(network, str(tmp_path / 'network.csv'))
+
+    attributes = tmp_path / 'attributes.csv'
+    attributes.write_text('key,score\n' + ''.join('gene{}-old1,{}\n'.format(number, number)
+                                                  for number in range(0, 300, 3)))
+    lists = tmp_path / 'lists.csv'
+    lists.write_text('hits,misses\ngene2,gene250\nP00005,\n')
+
+    tables = []
+    for handed_over in (False, True):
+        intermine_utils.cache.clear()
+        if handed_over:
+            model = AttR.AttR(gui=False, network=network, organism=ORGANISM)
+        else:
+            model = AttR.AttR(gui=False)
+            model.info.update({'NetR DataFrame': exporters.read_network_ids(network_path), 'Organism': ORGANISM})
+        submit(model, 'Discrete/Continuous', str(attributes), ['k', 'score'])
+        submit(model, 'List', str(lists), ['hits', 'misses'])
+        model.make_attribute_table(export=False)
+        tables.append(model.attribute_table().reset_index(drop=True))
+
+    pd.testing.assert_frame_equal(tables[0].astype(str), tables[1].astype(str))
+    table = tables[1].set_index('Mapping Key')
+    assert table['score'].notna().sum() == len([number for number in range(0, 300, 3)
+                                                if 'gene{}'.format(number) in table.index])
+    assert table.index[table['hits']].tolist() == ['gene2', 'gene5']
+    assert not table['misses'].any()
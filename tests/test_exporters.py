@@ -0,0 +1,81 @@
+from fake_intermine import ORGANISM
+import exporters
+import netr_core
+import pandas as pd
+import pytest
+
+EXTENSIONS = ['.csv', '.csv.gz', '.parquet', '.arrow', '.graphml', '.cx']
+
+
+@pytest.fixture(scope='module')
+def network(mine):
+    built = netr_core.Network(True)
+    built.append(netr_core.Wheel({'dataset_name': 'test', 'organism': ORGANISM, 'core': 'gene1', 'technique': 'Y2H',
+                                  'ids': ['gene{}'.format(number) for number in range(10)], 'download': True}))
+    # a core that cannot be resolved leaves the source of its edges unknown
+    built.append(netr_core.Wheel({'dataset_name': 'unresolved', 'organism': ORGANISM, 'core': 'bogus',
+                                  'technique': 'Y2H', 'ids': ['gene20', 'gene21'], 'download': True}))
+    return netr_core.make_network(built)
+
+
+def edge_ends(frame):
+    return sorted(tuple('' if pd.isna(end) else end for end in ends) for ends in frame.values.tolist())
+
+
+def needs_pyarrow(extension):
+    if extension in ('.parquet', '.arrow'):
+        pytest.importorskip('pyarrow')
+
+
+@pytest.mark.parametrize('extension', EXTENSIONS)
+def test_network_ids_round_trip(network, tmp_path, extension):
+    needs_pyarrow(extension)
+    path = exporters.write_network(network, str(tmp_path / ('network' + extension)))
+    ids = exporters.read_network_ids(path)
+    assert list(ids.columns) == exporters.ID_COLUMNS
+    assert network['Source Primary Identifier'].isna().sum() == 2
+    assert edge_ends(ids) == edge_ends(network[exporters.ID_COLUMNS].astype(object))
+
+
+@pytest.mark.parametrize('extension', ['.csv', '.csv.gz', '.parquet', '.arrow'])
+def test_network_tables_round_trip(network, tmp_path, extension):
+    needs_pyarrow(extension)
+    path = exporters.write_network(network, str(tmp_path / ('network' + extension)))
+    if extension in ('.parquet', '.arrow'):
+        read = pd.read_parquet(path) if extension == '.parquet' else pd.read_feather(path)
+    else:
+        read = pd.read_csv(path, dtype=str)
+    assert list(read.columns) == list(network.columns)
+    pd.testing.assert_frame_equal(read.astype(str), network.astype(str), check_categorical=False)
+
+
+def test_graph_formats_write_one_node_per_gene(network, tmp_path):
+    path = exporters.write_network(network, str(tmp_path / 'network.graphml'))
+    with open(path, encoding='utf8') as graphml_file:
+        graphml = graphml_file.read()
+    genes = set(network['Source Primary Identifier'].dropna()) | set(network['Target Primary Identifier'].dropna())
+    # every unknown end is a placeholder node of its own
+    assert graphml.count('<node ') == len(genes) + 2
+    assert graphml.count('<edge ') == network.shape[0]
+
+
+def test_attribute_tables_round_trip(tmp_path):
+    table = pd.DataFrame({'Symbol': ['gene1', 'gene2'], 'score': [1.5, None]}).set_index('Symbol')
+    path = exporters.write_table(table, str(tmp_path / 'attributes.csv'))
+    pd.testing.assert_frame_equal(pd.read_csv(path, index_col=0), table)
+
+
+@pytest.mark.parametrize('extension', ['.graphml', '.cx'])
+def test_attribute_tables_need_a_table_format(tmp_path, extension):
+    with pytest.raises(ValueError):
+        exporters.table_writer(str(tmp_path / ('attributes' + extension)))
+
+
+@pytest.mark.parametrize('path, extension', [('network.csv.gz', '.csv.gz'), ('NETWORK.GRAPHML', '.graphml'),
+                                             ('network.txt', '.csv')])
+def test_output_format(path, extension):
+    assert exporters.output_format(path) == extension
+
+
+def test_sibling_path():
+    assert exporters.sibling_path('network.csv.gz', '_lists') == 'network_lists.csv.gz'
@@ -0,0 +1,44 @@
+import json
+from fake_intermine import ORGANISM
+import instrumentation
+import intermine_utils
+import pytest
+
+
+@pytest.fixture
+def run_report(tmp_path):
+    report = instrumentation.enable(str(tmp_path / 'report.json'))
+    yield report
+    instrumentation.disable()
+
+
+def test_run_report(run_report):
+    instrumentation.count('queries')
+    instrumentation.count('queries', 2)
+    for value in (4, 1, 7):
+        instrumentation.observe('rows per query', value)
+    with instrumentation.timer('stage'):
+        pass
+
+    with open(instrumentation.write_report()) as report_file:
+        written = json.load(report_file)
+    assert written['counters'] == {'queries': 3}
+    assert written['distributions']['rows per query'] == {'count': 3, 'total': 12, 'min': 1, 'max': 7, 'mean': 4.0}
+    assert written['stages']['stage']['calls'] == 1
+    assert {'cache', 'mines', 'wall seconds', 'peak memory bytes'} <= set(written)
+
+
+def test_run_report_of_a_lookup(mine, run_report):
+    intermine_utils.lookup_rows_by_id(['gene1', 'gene2', 'P00003'], ORGANISM, ['symbol'])
+    written = run_report.to_dict()
+    assert written['counters']['queries'] == 3
+    assert written['counters']['requests'] >= 3
+    assert written['counters']['bytes received'] > 0
+    assert written['stages']['lookup_rows_by_id']['calls'] == 1
+    assert written['distributions']['rows per query']['count'] == 3
+
+
+def test_nothing_is_recorded_when_off():
+    assert not instrumentation.enabled()
+    instrumentation.count('queries')
+    assert instrumentation.write_report() is None
@@ -0,0 +1,109 @@
+from fake_intermine import ORGANISM
+from intermine.errors import WebserviceError
+import intermine_utils
+import pytest
+
+
+def rows_of(number):
+    return [('gene{}'.format(number), 'FBgn{:07d}'.format(number))]
+
+
+def test_attribute_rows_by_key_field(mine):
+    ids = ['gene1', 'FBgn0000002', 'CG00003']
+    by_id = intermine_utils._attribute_rows(ids, ORGANISM, ['symbol'])
+    assert by_id == {'gene1': rows_of(1), 'FBgn0000002': rows_of(2), 'CG00003': rows_of(3)}
+
+
+def test_attribute_rows_through_synonyms_and_cross_references(mine):
+    ids = ['gene4-old1', 'P00005', 'gene6', 'bogus']
+    queries = mine.queries
+    by_id = intermine_utils._attribute_rows(ids, ORGANISM, ['symbol'])
+    assert by_id == {'gene4-old1': rows_of(4), 'P00005': rows_of(5), 'gene6': rows_of(6), 'bogus': []}
+    # the lookup, the synonyms and the cross-references: never a query per ID
+    assert mine.queries - queries == 3
+
+
+def test_attribute_rows_of_many_cross_references_take_a_fixed_number_of_queries(mine):
+    ids = ['P{:05d}'.format(number) for number in range(200)]
+    queries = mine.queries
+    by_id = intermine_utils._attribute_rows(ids, ORGANISM, ['symbol'])
+    assert all(by_id[gene_id] == rows_of(number) for number, gene_id in enumerate(ids))
+    assert mine.queries - queries == 3
+
+
+def test_attribute_rows_of_an_alias_of_a_gene_another_id_matched(mine):
+    ids = ['P00070', 'gene70', 'gene71-old0', 'FBgn0000071']
+    by_id = intermine_utils._attribute_rows(ids, ORGANISM, ['symbol'])
+    assert by_id == {'P00070': rows_of(70), 'gene70': rows_of(70), 'gene71-old0': rows_of(71),
+                     'FBgn0000071': rows_of(71)}
+
+
+def test_attribute_rows_that_cannot_be_told_apart_are_looked_up_one_id_at_a_time(mine, monkeypatch):
+    # without cross-references, the genes of the accessions cannot be attributed from the chunk's response
+    monkeypatch.setattr(intermine_utils, '_has_path', lambda organism, path: False)
+    ids = ['P00080', 'P00081', 'gene82', 'bogus']
+    queries = mine.queries
+    by_id = intermine_utils._attribute_rows(ids, ORGANISM, ['symbol'])
+    assert by_id == {'P00080': rows_of(80), 'P00081': rows_of(81), 'gene82': rows_of(82), 'bogus': []}
+    assert mine.queries - queries == 2 + 3
+
+
+def test_lookup_rows_by_id_caches_the_rows_of_an_alias(mine):
+    assert intermine_utils.lookup_rows_by_id(['P00090', 'gene90'], ORGANISM, ['symbol']) == \
+        {'P00090': [('gene90', 'FBgn0000090')], 'gene90': [('gene90', 'FBgn0000090')]}
+    queries = mine.queries
+    assert intermine_utils.lookup_rows_by_id(['P00090'], ORGANISM, ['symbol']) == \
+        {'P00090': [('gene90', 'FBgn0000090')]}
+    assert mine.queries == queries
+
+
+def test_lookup_frames_of_an_alias_and_its_gene(mine):
+    frames = intermine_utils.lookup_frames([['gene70'], ['P00070']], ORGANISM, ['symbol'])
+    assert [frame['symbol'].tolist() for frame in frames] == [['gene70'], ['gene70']]
+
+
+def test_lookup_rows_by_id_keeps_the_order_of_the_views_and_uses_the_cache(mine):
+    ids = ['gene7', 'gene8-old0']
+    rows = intermine_utils.lookup_rows_by_id(ids, ORGANISM, ['symbol', 'secondaryIdentifier'])
+    assert rows == {'gene7': [('gene7', 'CG00007', 'FBgn0000007')], 'gene8-old0': [('gene8', 'CG00008', 'FBgn0000008')]}
+
+    queries = mine.queries
+    reordered = intermine_utils.lookup_rows_by_id(ids, ORGANISM, ['secondaryIdentifier', 'symbol'])
+    assert mine.queries == queries
+    assert reordered['gene7'] == [('CG00007', 'gene7', 'FBgn0000007')]
+
+
+def test_lookup_rows_merges_genes_matched_more_than_once(mine):
+    assert intermine_utils.lookup_rows(['gene9', 'FBgn0000009', 'gene10'], ORGANISM, ['symbol']) == \
+        [('gene9',), ('gene10',)]
+
+
+@pytest.mark.parametrize('error, overloaded', [
+    (WebserviceError(429, 'Too Many Requests', ''), True),
+    (WebserviceError('Internal server error', 500, ''), True),
+    (WebserviceError('Connection interrupted'), True),
+    (WebserviceError(400, 'Bad Request', ''), False),
+    (ValueError('not a request error'), False),
+])
+def test_overloaded(error, overloaded):
+    assert intermine_utils.overloaded(error) is overloaded
+
+
+def test_mine_controller_halves_on_throttling_and_grows_on_success():
+    controller = intermine_utils.MineController('http://mine.test')
+    controller.limit, controller.chunk_size = 4.0, 800
+    controller.failed(WebserviceError(429, 'Too Many Requests', ''))
+    assert (controller.limit, controller.chunk_size) == (2.0, 400)
+
+    controller.succeeded(0.1, 400)
+    assert controller.limit == 2.5
+    assert controller.chunk_size == 400 + intermine_utils.CHUNK_STEP
+
+
+def test_mine_controller_breaker_opens_after_repeated_failures():
+    controller = intermine_utils.MineController('http://mine.test')
+    for _ in range(intermine_utils.BREAKER_THRESHOLD):
+        controller.failed(WebserviceError('Internal server error', 500, ''))
+    assert controller.breaker_trips == 1
+    assert controller.limit == 1.0
+    assert controller.open_until > 0
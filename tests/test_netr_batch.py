@@ -0,0 +1,43 @@
+import json
+import NetR_batch
+import pandas as pd
+from fake_intermine import ORGANISM
+
+
+def write_manifest(folder, manifests):
+    path = folder / 'manifest.json'
+    path.write_text(json.dumps(manifests))
+    return str(path)
+
+
+def dataset(folder, name, ids, core='gene1'):
+    (folder / (name + '.csv')).write_text('\n'.join(ids) + '\n')
+    return {'name': name, 'file': name + '.csv', 'columns': [0], 'core': core, 'technique': 'Y2H'}
+
+
+def test_builds_every_network_of_a_manifest(mine, tmp_path, capsys):
+    manifests = [{'output': 'one.csv', 'organism': ORGANISM, 'download': True,
+                  'datasets': [dataset(tmp_path, 'a', ['gene{}'.format(number) for number in range(10)])]},
+                 {'output': 'two.graphml', 'organism': ORGANISM, 'collapse': True,
+                  'datasets': [dataset(tmp_path, 'b', ['gene20', 'gene21']), dataset(tmp_path, 'c', ['gene21'])]}]
+    assert NetR_batch.main([write_manifest(tmp_path, manifests)]) == 0
+
+    network = pd.read_csv(tmp_path / 'one.csv')
+    assert network.shape[0] == 10 + 10 * 3
+    assert set(network['Source Symbol'].iloc[:10]) == {'gene1'}
+    assert (tmp_path / 'two.graphml').exists()
+    assert '{}: 40 edges'.format(tmp_path / 'one.csv') in capsys.readouterr().out
+
+
+def test_reports_a_manifest_without_datasets_and_goes_on(mine, tmp_path, capsys):
+    manifests = [{'output': 'empty.csv', 'organism': ORGANISM, 'datasets': []},
+                 {'output': 'missing.csv', 'organism': ORGANISM},
+                 {'output': 'one.csv', 'organism': ORGANISM, 'datasets': [dataset(tmp_path, 'a', ['gene3'])]}]
+    assert NetR_batch.main([write_manifest(tmp_path, manifests)]) == 1
+
+    output = capsys.readouterr()
+    assert output.err.count('lists no datasets') == 2
+    assert not (tmp_path / 'empty.csv').exists()
+    # the core is paired with itself as well
+    assert pd.read_csv(tmp_path / 'one.csv').shape[0] == 2
+
@@ -0,0 +1,255 @@
+from fake_intermine import ORGANISM
+from intermine_utils import iter_merged_rows, lookup_rows_by_id
+import exporters
+import gzip
+import intermine_utils
+import json
+import netr_core
+import pandas as pd
+import pytest
+
+
+def edge(source, target, interaction='physical'):
+    return [source, source.upper(), 's' + source, interaction, 's' + target, target.upper(), target]
+
+
+def edge_frame(*edges):
+    return pd.DataFrame([edge(*ends) for ends in edges], columns=netr_core.EDGE_COLUMNS)
+
+
+def collapsed(index):
+    frame = index.to_frame()
+    return {(row['Source Primary Identifier'], row['Target Primary Identifier'], row['Interaction']):
+            (row['Evidence'], row['Datasets']) for _, row in frame.iterrows()}
+
+
+def test_edge_index_directed_keeps_both_directions():
+    index = netr_core.EdgeIndex(directed=True)
+    index.add(edge_frame(('a', 'b'), ('b', 'a'), ('a', 'b')), 'one')
+    index.add(edge_frame(('a', 'b'), ('a', 'b', 'genetic')), 'two')
+    assert collapsed(index) == {('a', 'b', 'physical'): (3, 'one;two'), ('b', 'a', 'physical'): (1, 'one'),
+                                ('a', 'b', 'genetic'): (1, 'two')}
+
+
+def test_edge_index_undirected_merges_both_directions():
+    index = netr_core.EdgeIndex(directed=False)
+    index.add(edge_frame(('b', 'a'), ('a', 'b')), 'one')
+    index.add(edge_frame(('a', 'b', 'genetic')), 'two')
+    edges = collapsed(index)
+    assert len(index) == 2
+    # the edge keeps the first row it was seen with
+    assert edges[('b', 'a', 'physical')] == (2, 'one')
+    assert edges[('a', 'b', 'genetic')] == (1, 'two')
+
+
+def wheel(ids, core='gene1'):
+    return netr_core.Wheel({'dataset_name': 'test', 'organism': ORGANISM, 'core': core, 'technique': 'Y2H',
+                            'ids': ids, 'download': True})
+
+
+def network(ids):
+    return network_of(ids)
+
+
+def network_of(ids, core='gene1'):
+    built = netr_core.Network(True)
+    built.append(wheel(ids, core))
+    return built
+
+
+def first_hop(ids):
+    return list(iter_merged_rows(lookup_rows_by_id(ids, ORGANISM, netr_core.SECONDARY_VIEWS), ids))
+
+
+def test_expansion_caps_the_edges_of_each_hop(mine):
+    rows = first_hop(['gene{}'.format(number) for number in range(10)])
+    edges = netr_core.Expansion(hops=3, max_hop_edges=4).expand(rows, ORGANISM)
+    assert edges[:4] == rows[:4]
+    assert 4 < len(edges) <= 12
+
+
+def test_expansion_caps_the_genes_of_each_hop(mine):
+    rows = first_hop(['gene{}'.format(number) for number in range(10)])
+    expansion = netr_core.Expansion(hops=2, max_hop_nodes=2)
+    edges = expansion.expand(rows, ORGANISM)
+    assert edges[:len(rows)] == rows
+    assert len({row[0] for row in edges[len(rows):]}) == 2
+
+
+def test_expansion_stops_at_the_total_caps(mine):
+    rows = first_hop(['gene{}'.format(number) for number in range(10)])
+    assert len(netr_core.Expansion(hops=5, max_edges=len(rows) + 5).expand(rows, ORGANISM)) == len(rows) + 5
+    # the ten genes of the first hop already use up 'max_nodes'
+    assert netr_core.Expansion(hops=5, max_nodes=10).expand(rows, ORGANISM) == rows
+
+
+def test_expansion_follows_only_the_selected_interaction_types(mine):
+    expansion = netr_core.Expansion(hops=2, interaction_types=['genetic'])
+    expanded = netr_core.make_network(network(['gene{}'.format(number) for number in range(10)]), fused=False,
+                                      expansion=expansion)
+    secondary = expanded[expanded['Interaction'] != 'Y2H']
+    assert set(secondary['Interaction']) == {'genetic'}
+
+
+def test_expansion_never_queries_a_visited_gene_again(mine, monkeypatch):
+    looked_up = []
+    lookup = netr_core.lookup_rows_by_id
+
+    def spy(ids, *args, **kwargs):
+        looked_up.append(list(ids))
+        return lookup(ids, *args, **kwargs)
+
+    monkeypatch.setattr(netr_core, 'lookup_rows_by_id', spy)
+    ids = ['gene{}'.format(number) for number in range(20)]
+    netr_core.make_network(network(ids), fused=False,
+                           expansion=netr_core.Expansion(hops=3, interaction_types=['genetic']))
+
+    # the hops look up primary identifiers; the wheel's own lookups are made with the submitted IDs
+    hops = [hop for hop in looked_up if hop and all(gene_id.startswith('FBgn') for gene_id in hop)]
+    first_hop = {'FBgn{:07d}'.format(number) for number in range(20)}
+    queried = [gene_id for hop in hops for gene_id in hop]
+    assert not first_hop.intersection(queried)
+    assert len(queried) == len(set(queried))
+
+
+def test_wheel_store_restores_the_frames_without_querying(mine, tmp_path):
+    store = netr_core.WheelStore(str(tmp_path))
+    ids = ['gene{}'.format(number) for number in range(10)] + ['bogus']
+    built = network(ids)
+    first = netr_core.make_network(built, store=store)
+
+    queries = mine.queries
+    restored = network(ids)
+    second = netr_core.make_network(restored, store=store)
+    assert mine.queries == queries
+    pd.testing.assert_frame_equal(first, second)
+    for name in netr_core.WheelStore.FRAMES:
+        pd.testing.assert_frame_equal(getattr(built[0], name), getattr(restored[0], name))
+
+    # the edge table is rebuilt from the stored frames instead of being stored as well
+    with gzip.open(store.path(built[0]), 'rt', encoding='utf8') as wheel_file:
+        assert set(json.load(wheel_file)) == set(netr_core.WheelStore.SOURCE_FRAMES)
+
+
+def test_wheel_store_ignores_unreadable_files(tmp_path):
+    store = netr_core.WheelStore(str(tmp_path))
+    stored = wheel(['gene2'])
+    with open(store.path(stored), 'wb') as wheel_file:
+        wheel_file.write(b'not a wheel')
+    assert store.load(stored) is False
+
+
+@pytest.mark.parametrize('directed', [True, False])
+def test_make_network_collapse(mine, directed):
+    built = netr_core.Network(True)
+    built.append(wheel(['gene{}'.format(number) for number in range(10)]))
+    built.append(wheel(['gene{}'.format(number) for number in range(5, 15)], core='gene2'))
+    frame = netr_core.make_network(built, collapse=True, directed=directed)
+    keys = [netr_core.EdgeIndex(directed).key(row) for row in frame[netr_core.EDGE_COLUMNS].itertuples(index=False)]
+    assert len(keys) == len(set(keys))
+    assert frame['Evidence'].sum() == netr_core.make_network(built).shape[0]
+
+
+@pytest.mark.parametrize('fused', [True, False])
+def test_planned_network_matches_each_wheel_resolved_alone(mine, fused):
+    wheels = [(['gene{}'.format(number) for number in range(60, 70)], 'P00070'),
+              (['gene70', 'gene72-old1', 'P00073', 'bogus'], 'gene5')]
+    planned = netr_core.Network(True)
+    for ids, core in wheels:
+        planned.append(wheel(ids, core))
+    frame = netr_core.make_network(planned, fused=fused)
+
+    intermine_utils.cache.clear()
+    alone = pd.concat([netr_core.make_network(network_of(ids, core), fused=fused) for ids, core in wheels],
+                      ignore_index=True)
+    assert frame.shape[0] == alone.shape[0]
+    pd.testing.assert_frame_equal(frame.astype(object), alone.astype(object))
+
+
+def test_make_network_of_no_wheels():
+    frame = netr_core.make_network(netr_core.Network(True))
+    assert list(frame.columns) == netr_core.EDGE_COLUMNS
+    assert frame.shape[0] == 0
+
+
+def test_fused_and_separate_queries_build_the_same_network(mine):
+    ids = ['gene{}'.format(number) for number in range(30)] + ['gene40-old1', 'P00041', 'bogus']
+    fused = netr_core.make_network(network_of(ids, 'gene2'), fused=True)
+    intermine_utils.cache.clear()
+    queries = mine.queries
+    separate = netr_core.make_network(network_of(ids, 'gene2'), fused=False)
+    assert mine.queries > queries
+    pd.testing.assert_frame_equal(fused.astype(object), separate.astype(object))
+
+
+def naive_edges(built):
+    """The edge table as the baseline built it: the core crossed with the primaries, then the secondaries"""
+    core = built.core.astype(object).reset_index(drop=True)
+    primaries = built.primary_interactors_df.astype(object).reset_index(drop=True)
+    if core.shape[0] == 0:
+        core = pd.DataFrame([[None] * len(netr_core.CORE_VIEWS)], columns=netr_core.CORE_VIEWS)
+    paired = core.merge(primaries, how='cross')
+    paired.columns = netr_core.EDGE_COLUMNS
+    secondaries = built.secondary_interactors_df.astype(object)
+    secondaries.columns = netr_core.EDGE_COLUMNS
+    return pd.concat([paired, secondaries], ignore_index=True)
+
+
+@pytest.mark.parametrize('core', ['gene2', 'bogus'])
+def test_convert_to_dataframe_builds_categorical_columns(mine, core):
+    built = network_of(['gene{}'.format(number) for number in range(8)] + ['bogus'], core)
+    netr_core.make_network(built)
+    frame = built[0].dataframe
+    assert list(frame.columns) == netr_core.EDGE_COLUMNS
+    assert all(isinstance(dtype, pd.CategoricalDtype) for dtype in frame.dtypes)
+    # the core is among the IDs, and bogus IDs resolve to nothing
+    assert frame.shape[0] == 8 + 8 * 3
+    assert frame['Source Primary Identifier'].iloc[:8].isna().all() == (core == 'bogus')
+    edges = frame.astype(object)
+    pd.testing.assert_frame_equal(edges.where(edges.notna(), None), naive_edges(built[0]))
+
+
+def test_read_dataset_ids_reads_only_the_selected_columns_as_text(tmp_path, monkeypatch):
+    path = tmp_path / 'dataset.csv'
+    path.write_text('id,score,alias,note\n0123, 1.5,gene2,x\n007,2,gene3,y\n')
+    read = []
+    read_csv = pd.read_csv
+
+    def spy(*args, **kwargs):
+        read.append(kwargs)
+        return read_csv(*args, **kwargs)
+
+    monkeypatch.setattr(pd, 'read_csv', spy)
+    ids = netr_core.read_dataset_ids(str(path), ['alias', 0], header=True)
+    # leading zeros survive, and the IDs are listed column by column in the order selected
+    assert ids.tolist() == ['gene2', 'gene3', '0123', '007']
+    assert read[-1]['usecols'] == [0, 2]
+    assert read[-1]['dtype'] is str
+
+
+def test_read_dataset_ids_without_header(tmp_path):
+    path = tmp_path / 'dataset.csv'
+    path.write_text('gene1,a, gene2 \ngene3,b,gene4\n')
+    assert netr_core.read_dataset_ids(str(path), [2, 0]).tolist() == ['gene2', 'gene4', 'gene1', 'gene3']
+
+
+def test_make_network_with_a_writer_resolves_one_wheel_at_a_time(mine, tmp_path, monkeypatch):
+    built = netr_core.Network(True)
+    built.append(wheel(['gene{}'.format(number) for number in range(10)]))
+    built.append(wheel(['gene{}'.format(number) for number in range(5, 15)] + ['P00030'], core='gene2'))
+    expected = netr_core.make_network(built)
+
+    resolved = []
+    resolve_network = netr_core.resolve_network
+
+    def spy(network, max_workers, fused, wheels=None):
+        resolved.append([wheel.name for wheel in wheels])
+        return resolve_network(network, max_workers, fused, wheels)
+
+    monkeypatch.setattr(netr_core, 'resolve_network', spy)
+    path = str(tmp_path / 'network.csv')
+    with exporters.network_writer(path) as writer:
+        assert netr_core.make_network(built, writer=writer) == expected.shape[0]
+    assert resolved == [['test'], ['test']]
+    written = pd.read_csv(path, dtype=str, keep_default_na=False)
+    pd.testing.assert_frame_equal(written, expected.astype(object).fillna(''), check_dtype=False)
@@ -0,0 +1,61 @@
+from fake_intermine import ORGANISM
+import synonym_index
+
+GENES = [
+    ('abc', ('abc', 'FBgn0000001', 'CG0001'), ['abc-old', 'shared']),
+    ('def', ('def', 'FBgn0000002', 'CG0002'), ['shared', 'abc']),
+    ('', ('', 'FBgn0000003', None), ['nameless']),
+]
+
+
+def test_lookups(tmp_path):
+    index = synonym_index.SynonymIndex.build(str(tmp_path / 'index'), GENES)
+    assert index.get('FBgn0000002') == 'def'
+    assert index.get(' CG0001 ') == 'abc'
+    assert index.get('abc-old') == 'abc'
+    assert index.get('missing', 'default') == 'default'
+    assert 'shared' in index
+    assert 'nameless' not in index
+    # a synonym never shadows a current identifier, and the first gene keeps a shared synonym
+    assert index.get('abc') == 'abc'
+    assert index.get('shared') == 'abc'
+    assert index.map(['def', 'missing', None, 'def']) == ['def', None, None, 'def']
+    assert len(index) == 8
+
+
+def test_empty_index(tmp_path):
+    index = synonym_index.SynonymIndex.build(str(tmp_path / 'index'), [])
+    assert len(index) == 0
+    assert index.get('abc') is None
+
+
+def test_download_index(mine, tmp_path, monkeypatch):
+    monkeypatch.setenv('NETRATTR_SYNONYM_DIR', str(tmp_path))
+    assert synonym_index.load_index(ORGANISM) is None
+
+    index = synonym_index.download_index(ORGANISM)
+    assert synonym_index.load_index(ORGANISM) is index
+    assert index.get('FBgn0000012') == 'gene12'
+    assert index.get('CG00013') == 'gene13'
+    assert index.get('gene14-old1') == 'gene14'
+    assert index.map(['gene299', 'gene300']) == ['gene299', None]
+
+    # downloading again swaps the new index in
+    assert synonym_index.download_index(ORGANISM) is not index
+    synonym_index._indexes.clear()
+
+
+def test_expired_index_is_not_used(mine, tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('NETRATTR_SYNONYM_DIR', str(tmp_path))
+    index = synonym_index.download_index(ORGANISM)
+    assert synonym_index.load_index(ORGANISM) is index
+
+    monkeypatch.setenv('NETRATTR_CACHE_TTL', '3600')
+    monkeypatch.setitem(index.meta, 'created', index.meta['created'] - 2 * 86400)
+    assert synonym_index.load_index(ORGANISM) is None
+    assert synonym_index.load_index(ORGANISM) is None
+    # the warning is printed once
+    assert capsys.readouterr().err.count('has expired') == 1
+
+    assert synonym_index.download_index(ORGANISM) is not None
+    synonym_index._indexes.clear()